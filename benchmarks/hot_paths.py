@@ -0,0 +1,470 @@
+"""
+Time of the hot paths of inference and training, without network or weights
+
+Usage:
+    python benchmarks/hot_paths.py --output hot_paths.json
+    python benchmarks/hot_paths.py --batch-sizes 1 8 32 --seq-lengths 16 64 128 --images 64 --threads 4
+    python benchmarks/hot_paths.py --ocr-engine easyocr --skip dataset train
+
+Everything is synthetic: meme-like images with rendered captions, a vocab
+of a few hundred tokens and a bert of random weights (--hidden-size,
+--layers), all created in a temporary folder. The datasets read
+"bert-base-uncased" with from_pretrained, a tokenizer with that name is
+saved in the folder and the datasets are created from it, so nothing is
+downloaded. The ocr is only measured with an engine that is installed and
+has its weights (tesseract by default, "none" skips it). A part whose
+dependencies are missing is saved as skipped with the reason.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+# the tokenizer of the datasets must be read from the temporary folder
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import torch
+from PIL import Image, ImageDraw, ImageFont
+
+from src.checkpoint import load_tokenizer
+from src.classifier import load_image, recognize_text
+from src.engine import set_threads
+from src.model import CNN, BertModelClassification, ModelMixBert
+from src.ocr.cache import OCRCache
+from src.ocr.engines import OCR_ENGINES, create_engine
+
+PARTS = ("load_image", "ocr", "tokenize", "forward", "dataset", "train")
+
+WORDS = ("cuando", "el", "la", "de", "que", "no", "me", "mi", "es", "un", "una", "por", "para", "con",
+         "profe", "examen", "lunes", "viernes", "gato", "perro", "mamá", "papá", "plata", "sueldo",
+         "gobierno", "congreso", "presidente", "elecciones", "partido", "fútbol", "gol", "selección",
+         "lluvia", "calor", "frío", "marcha", "protesta", "pandemia", "vacuna", "pizza", "completo",
+         "when", "you", "the", "my", "face", "nobody", "me", "bro", "meme", "sticker", "literally",
+         "monday", "friday", "cat", "dog", "money", "exam", "teacher", "vote", "goal", "rain")
+
+SPECIAL_TOKENS = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"]
+
+
+def make_vocab() -> list:
+
+    """
+    Vocab of the synthetic bert, the words of the captions and single characters so any text is tokenized
+    """
+
+    characters = "abcdefghijklmnopqrstuvwxyzáéíóúñü0123456789"
+    vocab = SPECIAL_TOKENS + sorted(set(WORDS))
+    vocab += [character for character in characters if character not in vocab]
+    vocab += ["##" + character for character in characters]
+    return vocab
+
+
+def make_caption(rng, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def load_font(size: int):
+
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        # Pillow < 10.1 has only the bitmap font
+        return ImageFont.load_default()
+
+
+def make_meme(rng, width: int, height: int) -> tuple:
+
+    """
+    Image with a caption on top and at the bottom, like the impact memes
+
+    :return: tuple (PIL image, caption)
+    """
+
+    background = tuple(rng.randrange(256) for _ in range(3))
+    image = Image.new("RGB", (width, height), background)
+    draw = ImageDraw.Draw(image)
+    # a few shapes, so the jpeg is not a flat color
+    for _ in range(6):
+        x, y = rng.randrange(width), rng.randrange(height)
+        draw.ellipse((x, y, x + rng.randrange(20, width // 2), y + rng.randrange(20, height // 2)),
+                     fill=tuple(rng.randrange(256) for _ in range(3)))
+
+    font = load_font(max(height // 12, 10))
+    top, bottom = make_caption(rng, rng.randint(2, 6)), make_caption(rng, rng.randint(2, 6))
+    for text, y in ((top, height // 20), (bottom, height - height // 6)):
+        draw.text((width // 20, y), text.upper(), font=font, fill="white", stroke_width=2, stroke_fill="black")
+    return image, f"{top} {bottom}"
+
+
+def make_images(folder: str, count: int, size: tuple, seed: int) -> list:
+
+    """
+    Save count synthetic memes in a folder
+
+    :return: list of tuples (path, caption)
+    """
+
+    rng = random.Random(seed)
+    os.makedirs(folder, exist_ok=True)
+    images = []
+    for index in range(count):
+        image, caption = make_meme(rng, *size)
+        path = os.path.join(folder, f"meme_{index:05d}.jpg")
+        image.save(path, quality=90)
+        images.append((path, caption))
+    return images
+
+
+def build_bert(vocab_size: int, hidden_size: int, layers: int):
+
+    """
+    Bert of random weights with the architecture of bert-base, smaller
+    """
+
+    from transformers import BertConfig, BertModel
+
+    config = BertConfig(vocab_size=vocab_size, hidden_size=hidden_size, num_hidden_layers=layers,
+                        num_attention_heads=max(hidden_size // 64, 1), intermediate_size=hidden_size * 4)
+    return BertModel(config)
+
+
+def build_models(vocab_size: int, hidden_size: int, layers: int) -> dict:
+
+    """
+    Create the classifier of memes (bert + cnn) and the classifier of topics (only bert)
+    """
+
+    torch.manual_seed(0)
+    return {
+        "ModelMixBert": ModelMixBert(CNN(256), BertModelClassification(build_bert(vocab_size, hidden_size, layers),
+                                                                       256), 512, 3),
+        "BertModelClassification": BertModelClassification(build_bert(vocab_size, hidden_size, layers), 7),
+    }
+
+
+def time_call(function, repeat: int, warmup: int = 1) -> dict:
+
+    """
+    Run a function several times
+
+    :return: dict with the mean, min and median seconds of a call
+    """
+
+    for _ in range(warmup):
+        function()
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        seconds.append(time.perf_counter() - start)
+    return {
+        "repeat": repeat,
+        "seconds_mean": statistics.fmean(seconds),
+        "seconds_min": min(seconds),
+        "seconds_p50": statistics.median(seconds),
+    }
+
+
+def time_per_item(function, items: list, rounds: int = 1) -> dict:
+
+    """
+    Run a function over every item, the first round is a warmup
+
+    :return: dict with the mean, min and median seconds per item
+    """
+
+    for item in items:
+        function(item)
+    seconds = []
+    for _ in range(rounds):
+        for item in items:
+            start = time.perf_counter()
+            function(item)
+            seconds.append(time.perf_counter() - start)
+    return {
+        "items": len(seconds),
+        "seconds_mean": statistics.fmean(seconds),
+        "seconds_min": min(seconds),
+        "seconds_p50": statistics.median(seconds),
+    }
+
+
+def skipped(name: str, error: Exception) -> dict:
+    return {"name": name, "skipped": f"{type(error).__name__}: {error}"}
+
+
+def bench_load_image(images: list, rounds: int) -> list:
+
+    paths = [path for path, _ in images]
+    return [{"name": "load_image", **time_per_item(load_image, paths, rounds)}]
+
+
+def bench_ocr(images: list, engine_name: str, workspace: str, rounds: int) -> list:
+
+    """
+    recognize_text with the engine and with a hit of the ocr cache
+    """
+
+    paths = [path for path, _ in images]
+    engine = create_engine(engine_name)
+    results = []
+    try:
+        engine.load()
+        results.append({"name": "recognize_text", "engine": engine_name,
+                        **time_per_item(lambda path: recognize_text(path, engine), paths, rounds)})
+    except Exception as error:
+        results.append({**skipped("recognize_text", error), "engine": engine_name})
+
+    # the cache key only needs the config of the engine, the reader is not used on a hit
+    cache = OCRCache(os.path.join(workspace, "ocr_cache.db"))
+    try:
+        for path, caption in images:
+            key = cache.make_key(open(path, "rb").read(), engine.get_config())
+            cache.put(key, [([[0, 0], [1, 0], [1, 1], [0, 1]], caption, 1.0)])
+        results.append({"name": "recognize_text_cache_hit", "engine": engine_name,
+                        **time_per_item(lambda path: recognize_text(path, engine, cache), paths, rounds)})
+    finally:
+        cache.close()
+    return results
+
+
+def bench_tokenize(tokenizer, images: list, seq_lengths: list, rounds: int) -> list:
+
+    """
+    encode_plus of the captions as in prepare_sample_bert, for each max length
+    """
+
+    rng = random.Random(1)
+    # long ocr texts, so the larger max lengths truncate too
+    texts = [caption + " " + make_caption(rng, max(seq_lengths)) for _, caption in images]
+    results = []
+    for length in seq_lengths:
+        def encode(text):
+            tokenizer.encode_plus(text=text, add_special_tokens=True, max_length=length,
+                                  return_attention_mask=True, return_tensors="pt", truncation=True)
+        results.append({"name": "tokenize", "seq_length": length, **time_per_item(encode, texts, rounds)})
+    return results
+
+
+def bench_forward(models: dict, vocab_size: int, batch_sizes: list, seq_lengths: list, repeat: int) -> list:
+
+    """
+    Forward of each model with random tokens of every batch size and length
+    """
+
+    results = []
+    for name, model in models.items():
+        model.eval()
+        for batch_size in batch_sizes:
+            for length in seq_lengths:
+                text = torch.randint(len(SPECIAL_TOKENS), vocab_size, (batch_size, length))
+                mask = torch.ones_like(text)
+                image = torch.randn(batch_size, 3, 56, 56)
+                if name == "ModelMixBert":
+                    inputs = (image, text, mask)
+                else:
+                    inputs = (text, mask)
+
+                def forward():
+                    with torch.inference_mode():
+                        model(*inputs)
+
+                result = time_call(forward, repeat)
+                result["samples_per_second"] = batch_size / result["seconds_p50"]
+                results.append({"name": "forward", "model": name, "batch_size": batch_size, "seq_length": length,
+                                **result})
+                print(f"forward {name} | batch {batch_size} | largo {length} | "
+                      f"{result['seconds_p50'] * 1000:.1f} ms | {result['samples_per_second']:.1f} muestras/s")
+    return results
+
+
+def write_dataset_files(workspace: str, images: list, tokenizer) -> dict:
+
+    """
+    Copy the images in the folders read by the datasets and write their annotations
+
+    ImageTextData reads ./<class>/img_<id>.jpg and the token ids of its vocab,
+    DataLoaderCategory reads final.csv and ./categoria/images/<link>
+
+    :return: dict of ImageTextData
+    """
+
+    import pandas as pd
+
+    tokenizer.save_pretrained(os.path.join(workspace, "bert-base-uncased"))
+
+    targets_names = {"1": "Meme", "2": "No Meme", "3": "Sticker"}
+    vocab = {word: index + 2 for index, word in enumerate(sorted(set(WORDS)))}
+    data = {"vocab": vocab, "targets_names": targets_names, "images": {"img_ids": [], "texts": [], "targets": []}}
+    rows = {"TEMA_meme": [], "links": [], "text_manual": []}
+    os.makedirs(os.path.join(workspace, "categoria", "images"), exist_ok=True)
+    for index, (path, caption) in enumerate(images):
+        target = index % 3 + 1
+        folder = os.path.join(workspace, targets_names[str(target)])
+        os.makedirs(folder, exist_ok=True)
+        os.link(path, os.path.join(folder, f"img_{index:07d}.jpg"))
+        data["images"]["img_ids"].append(index)
+        data["images"]["texts"].append([vocab[word] for word in caption.split()])
+        data["images"]["targets"].append(target)
+
+        link = os.path.basename(path)
+        os.link(path, os.path.join(workspace, "categoria", "images", link))
+        rows["TEMA_meme"].append(index % 7)
+        rows["links"].append(link)
+        rows["text_manual"].append(caption)
+
+    pd.DataFrame(rows).to_csv(os.path.join(workspace, "final.csv"), index=False)
+    return data
+
+
+def bench_datasets(workspace: str, images: list, tokenizer, repeat: int) -> list:
+
+    """
+    Creation of ImageTextData and DataLoaderCategory from the files of write_dataset_files
+    """
+
+    data = write_dataset_files(workspace, images, tokenizer)
+    results = []
+    cwd = os.getcwd()
+    os.chdir(workspace)
+    try:
+        try:
+            from src.data_load.data_loader import ImageTextData
+
+            result = time_call(lambda: ImageTextData(json.loads(json.dumps(data)), bert=True), repeat)
+            results.append({"name": "ImageTextData", "images": len(images), **result})
+        except ImportError as error:
+            results.append(skipped("ImageTextData", error))
+
+        try:
+            # the module prints the working directory when it is imported
+            with contextlib.redirect_stdout(io.StringIO()):
+                from src.data_load.data_loader_category import DataLoaderCategory
+
+            result = time_call(lambda: DataLoaderCategory("final.csv", BERT=True), repeat)
+            results.append({"name": "DataLoaderCategory", "images": len(images), **result})
+        except ImportError as error:
+            results.append(skipped("DataLoaderCategory", error))
+    finally:
+        os.chdir(cwd)
+    return results
+
+
+def bench_train(model, vocab_size: int, samples: int, batch_size: int, seq_length: int) -> list:
+
+    """
+    One epoch of Train.train_bert with the image, over random samples
+    """
+
+    try:
+        from src.train_model import Train
+    except ImportError as error:
+        return [skipped("train_bert", error)]
+
+    generator = torch.Generator().manual_seed(0)
+    dataset = torch.utils.data.TensorDataset(
+        torch.randn(samples, 3, 56, 56, generator=generator),
+        torch.zeros(samples, 1, dtype=torch.int64),
+        torch.randint(len(SPECIAL_TOKENS), vocab_size, (samples, seq_length), generator=generator),
+        torch.ones(samples, seq_length, dtype=torch.int64),
+        torch.randint(0, 3, (samples,), generator=generator),
+    )
+    train_loader = torch.utils.data.DataLoader(dataset, batch_size=batch_size, shuffle=True)
+    test_loader = torch.utils.data.DataLoader(dataset, batch_size=batch_size)
+    model.train()
+    # the test split is evaluated once, at the end of the epoch
+    train = Train(model, torch.optim.Adam(model.parameters(), lr=1e-4), torch.nn.CrossEntropyLoss(),
+                  train_loader, test_loader, epochs=1, prints_every=len(train_loader), device="cpu")
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        train.train_bert(include_image=True)
+    seconds = time.perf_counter() - start
+    return [{"name": "train_bert", "samples": samples, "batch_size": batch_size, "seq_length": seq_length,
+             "seconds": seconds, "samples_per_second": samples / seconds}]
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Time of the hot paths of inference and training")
+    parser.add_argument("--images", type=int, default=32, help="number of synthetic images")
+    parser.add_argument("--image-size", type=int, nargs=2, default=[800, 600], metavar=("WIDTH", "HEIGHT"))
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--seq-lengths", type=int, nargs="+", default=[16, 64, 128])
+    parser.add_argument("--hidden-size", type=int, default=128, help="hidden size of the random bert")
+    parser.add_argument("--layers", type=int, default=2, help="layers of the random bert")
+    parser.add_argument("--repeat", type=int, default=10, help="measured calls of each forward and dataset")
+    parser.add_argument("--rounds", type=int, default=3, help="passes over the images of the per image parts")
+    parser.add_argument("--ocr-engine", choices=list(OCR_ENGINES) + ["none"], default="tesseract")
+    parser.add_argument("--train-samples", type=int, default=256)
+    parser.add_argument("--threads", type=int, default=None, help="threads of torch")
+    parser.add_argument("--skip", nargs="+", choices=PARTS, default=[], help="parts that are not measured")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="json file where the results are saved")
+    args = parser.parse_args()
+
+    set_threads(args.threads)
+    vocab = make_vocab()
+    tokenizer = load_tokenizer(vocab)
+    parts = [part for part in PARTS if part not in args.skip]
+    if args.ocr_engine == "none" and "ocr" in parts:
+        parts.remove("ocr")
+
+    results = []
+    with tempfile.TemporaryDirectory() as workspace:
+        images = make_images(os.path.join(workspace, "images"), args.images, tuple(args.image_size), args.seed)
+        models = build_models(len(vocab), args.hidden_size, args.layers)
+
+        for part in parts:
+            start = time.perf_counter()
+            if part == "load_image":
+                part_results = bench_load_image(images, args.rounds)
+            elif part == "ocr":
+                part_results = bench_ocr(images, args.ocr_engine, workspace, args.rounds)
+            elif part == "tokenize":
+                part_results = bench_tokenize(tokenizer, images, args.seq_lengths, args.rounds)
+            elif part == "forward":
+                part_results = bench_forward(models, len(vocab), args.batch_sizes, args.seq_lengths, args.repeat)
+            elif part == "dataset":
+                part_results = bench_datasets(workspace, images, tokenizer, max(args.repeat // 5, 1))
+            else:
+                part_results = bench_train(models["ModelMixBert"], len(vocab), args.train_samples,
+                                           max(args.batch_sizes), min(args.seq_lengths))
+            results.extend(part_results)
+
+            for result in part_results:
+                if "skipped" in result:
+                    print(f"{result['name']}: omitido ({result['skipped']})")
+                elif part in ("load_image", "ocr", "tokenize"):
+                    print(f"{result['name']} {result.get('seq_length', '')} | "
+                          f"{result['seconds_p50'] * 1000:.2f} ms por imagen")
+                elif part in ("dataset", "train"):
+                    print(f"{result['name']} | {result.get('seconds_p50', result.get('seconds')):.2f} s")
+            print(f"== {part}: {time.perf_counter() - start:.1f} s")
+
+    report = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "platform": platform.platform(),
+        "threads": torch.get_num_threads(),
+        "config": vars(args),
+        "results": results,
+    }
+    if args.output is not None:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
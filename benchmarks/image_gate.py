@@ -0,0 +1,59 @@
+"""
+Fraction of images and accuracy of each path of the image only gate
+
+Usage:
+    python benchmarks/image_gate.py weight_models/cnn --data dataset.json
+    python benchmarks/image_gate.py weight_models/cnn --data dataset.json --thresholds 0.8 0.9 0.95
+
+The held-out set is the test split of the data loader used in training,
+run it from the folder that has the images of the dataset. For each
+threshold the images over it are classified only by the image model
+and the rest by ModelMixBert.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from run import load_bert
+from src.gate import evaluate_gate, load_image_classifier
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Paths of the image only gate")
+    parser.add_argument("image_model", help="weights of the image only model")
+    parser.add_argument("--data", required=True, help="json of the classifier dataset")
+    parser.add_argument("--checkpoint", default=None, help="checkpoint of the classifier, by default weight_models is used")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.5, 0.7, 0.8, 0.9, 0.95, 0.99])
+    parser.add_argument("--output", default=None, help="json file where the results are saved")
+    args = parser.parse_args()
+
+    from src.data_load.data_loader import load_split_data
+
+    with open(args.data) as data_file:
+        dataset = json.load(data_file)
+    _, test_loader, _ = load_split_data(dataset, batch_size=args.batch_size, bert=True)
+
+    model, _ = load_bert("classifier", args.checkpoint)
+    image_model = load_image_classifier(args.image_model)
+    results = evaluate_gate(image_model, model, test_loader, args.thresholds)
+
+    print("umbral | solo imagen | acc imagen | ocr + bert | acc bert | acc total")
+    for result in results:
+        accuracy_image = "-" if result["accuracy_image"] is None else f"{result['accuracy_image']:.3f}"
+        accuracy_bert = "-" if result["accuracy_bert"] is None else f"{result['accuracy_bert']:.3f}"
+        print(f"{result['threshold']:.2f} | {result['fraction_image']:.1%} | {accuracy_image} | "
+              f"{result['fraction_bert']:.1%} | {accuracy_bert} | {result['accuracy']:.3f}")
+
+    if args.output is not None:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
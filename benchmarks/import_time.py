@@ -0,0 +1,123 @@
+"""
+Measure the import time of the classifier modules and the startup of run.py
+
+Usage:
+    python benchmarks/import_time.py [--repeat 3] [--top 10] [--output import_time.json]
+
+Each measure runs in a new interpreter with -X importtime, the wall time
+and the packages that take the most time to import are reported.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TARGETS = {
+    "run.py --help": [os.path.join(ROOT, "run.py"), "--help"],
+    "src.classifier": ["-c", "import src.classifier"],
+    "src.model": ["-c", "import src.model"],
+    "src.checkpoint": ["-c", "import src.checkpoint"],
+    "src.server": ["-c", "import src.server"],
+    "src.data_load.data_augmentation": ["-c", "import src.data_load.data_augmentation"],
+}
+
+
+def parse_importtime(stderr: str) -> list:
+
+    """
+    Parse the output of -X importtime
+
+    :param stderr: stderr of the interpreter
+
+    :return: list of (package, self microseconds, cumulative microseconds)
+    """
+
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, package = line[len("import time:"):].split("|")
+        imports.append((package[1:].rstrip(), int(self_us), int(cumulative_us)))
+    return imports
+
+
+def group_by_package(imports: list) -> list:
+
+    """
+    Add the self time of the modules of each top level package
+
+    :param imports: list returned by parse_importtime
+
+    :return: list of (package, self microseconds) from slowest to fastest
+    """
+
+    totals = {}
+    for module, self_us, _ in imports:
+        package = module.strip().split(".")[0]
+        totals[package] = totals.get(package, 0) + self_us
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)
+
+
+def measure(args: list, repeat: int) -> dict:
+
+    """
+    Run a target several times and keep the fastest run
+
+    :param args: arguments of the interpreter
+    :param repeat: number of runs
+
+    :return: dict with the wall time and the imports of the fastest run
+    """
+
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        process = subprocess.run([sys.executable, "-X", "importtime"] + args, cwd=ROOT,
+                                 capture_output=True, text=True)
+        wall = time.perf_counter() - start
+        if process.returncode != 0:
+            return {"error": process.stderr.strip().splitlines()[-1]}
+        if best is None or wall < best["wall_seconds"]:
+            best = {"wall_seconds": wall, "imports": parse_importtime(process.stderr)}
+    return best
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Import time benchmark")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per target, the fastest is kept")
+    parser.add_argument("--top", type=int, default=10, help="number of top level packages reported")
+    parser.add_argument("--output", default=None, help="json file where the results are saved")
+    args = parser.parse_args()
+
+    results = {}
+    for name, target in TARGETS.items():
+        result = measure(target, args.repeat)
+        if "error" in result:
+            print(f"{name}: error {result['error']}")
+            results[name] = result
+            continue
+
+        packages = group_by_package(result["imports"])[:args.top]
+        results[name] = {
+            "wall_seconds": result["wall_seconds"],
+            "slowest": [{"package": package, "self_us": self_us} for package, self_us in packages],
+        }
+
+        print(f"{name}: {result['wall_seconds']:.3f}s")
+        for package, self_us in packages:
+            print(f"    {self_us / 1000:9.1f} ms  {package}")
+
+    if args.output is not None:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
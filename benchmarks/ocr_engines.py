@@ -0,0 +1,114 @@
+"""
+Speed, memory and quality of the text of each OCR engine
+
+Usage:
+    python benchmarks/ocr_engines.py --data final.csv
+    python benchmarks/ocr_engines.py --data final.csv --engines easyocr tesseract --limit 100 --output engines.json
+
+Each engine runs in its own process, so the peak memory of one engine
+does not hide the other. The quality is measured against the text_manual
+column of final.csv, the images are read from --images.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.ocr.engines import OCR_ENGINES, create_engine
+from src.ocr.quality import load_reference_texts, text_similarity, word_recall
+from src.utils.image_source import ImageSource
+from src.utils.metrics import get_peak_rss
+
+
+def measure(name, references) -> dict:
+
+    """
+    Run the OCR of an engine over every image
+
+    :return: dict with the images per second, the peak memory, the mean similarity and word recall
+    """
+
+    engine = create_engine(name)
+    start = time.perf_counter()
+    engine.load()
+    # warmup, the first image also initializes the backend
+    engine.readtext(ImageSource(references[0][0]).array)
+    load_seconds = time.perf_counter() - start
+
+    seconds = 0.0
+    similarity = 0.0
+    recall = 0.0
+    for path, reference in references:
+        array = ImageSource(path).array
+        start = time.perf_counter()
+        result = engine.readtext(array)
+        seconds += time.perf_counter() - start
+
+        text = " ".join(element[1] for element in result)
+        similarity += text_similarity(text, reference)
+        recall += word_recall(text, reference)
+
+    total = max(len(references), 1)
+    # the children are included because tesseract runs as a new process
+    peak = get_peak_rss()
+    return {
+        "engine": name,
+        "images": len(references),
+        "load_seconds": load_seconds,
+        "images_per_second": len(references) / seconds if seconds else 0.0,
+        "peak_memory_mb": peak / 2 ** 20 if peak is not None else None,
+        "similarity": similarity / total,
+        "word_recall": recall / total,
+    }
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Speed, memory and text quality of the OCR engines")
+    parser.add_argument("--data", default="final.csv", help="csv with the links and text_manual columns")
+    parser.add_argument("--images", default="./categoria/images", help="folder of the images of the csv")
+    parser.add_argument("--engines", nargs="+", choices=list(OCR_ENGINES), default=list(OCR_ENGINES))
+    parser.add_argument("--limit", type=int, default=None, help="max number of images")
+    parser.add_argument("--output", default=None, help="json file where the results are saved")
+    parser.add_argument("--child", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    references = load_reference_texts(args.data, args.images, args.limit)
+    if not references:
+        print(f"No se encontraron imágenes de {args.data} en {args.images}")
+        sys.exit(1)
+
+    if args.child is not None:
+        print(json.dumps(measure(args.child, references)))
+        return
+
+    results = []
+    for name in args.engines:
+        command = [sys.executable, os.path.abspath(__file__), "--data", args.data, "--images", args.images,
+                   "--child", name]
+        if args.limit is not None:
+            command += ["--limit", str(args.limit)]
+        output = subprocess.run(command, capture_output=True, text=True)
+        if output.returncode != 0:
+            print(f"{name}: error\n{output.stderr.strip()}")
+            continue
+
+        results.append(json.loads(output.stdout.strip().splitlines()[-1]))
+        result = results[-1]
+        memory = f"{result['peak_memory_mb']:.0f} MB" if result["peak_memory_mb"] is not None else "no disponible"
+        print(f"{name} | {result['images_per_second']:.2f} imágenes/s | carga: {result['load_seconds']:.1f} s | "
+              f"memoria: {memory} | similitud: {result['similarity']:.3f} | "
+              f"palabras: {result['word_recall']:.3f}")
+
+    if args.output is not None:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Time of the OCR against the quality of the recognized text for several
+resolutions of the image given to easyocr
+
+Usage:
+    python benchmarks/ocr_resolution.py --data final.csv
+    python benchmarks/ocr_resolution.py --data final.csv --max-sides 0 1600 1024 800 --grayscale --limit 100
+
+The quality is measured against the text_manual column of final.csv, the
+images are read from --images (the links column). A max side of 0 keeps
+the full resolution.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.ocr.engines import create_engine
+from src.ocr.preprocess import OCRPreprocess
+from src.ocr.quality import load_reference_texts, text_similarity, word_recall
+from src.utils.image_source import ImageSource
+
+
+def measure(reader, references, preprocess) -> dict:
+
+    """
+    Run the OCR over every image with a preprocess
+
+    :return: dict with the seconds per image, the mean similarity and word recall
+    """
+
+    seconds = 0.0
+    similarity = 0.0
+    recall = 0.0
+    for path, reference in references:
+        start = time.perf_counter()
+        result = reader.readtext(preprocess(ImageSource(path)))
+        seconds += time.perf_counter() - start
+
+        text = " ".join(element[1] for element in result)
+        similarity += text_similarity(text, reference)
+        recall += word_recall(text, reference)
+
+    total = max(len(references), 1)
+    return {
+        "max_side": preprocess.max_side,
+        "grayscale": preprocess.grayscale,
+        "images": len(references),
+        "seconds_per_image": seconds / total,
+        "similarity": similarity / total,
+        "word_recall": recall / total,
+    }
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="OCR time against text quality by resolution")
+    parser.add_argument("--data", default="final.csv", help="csv with the links and text_manual columns")
+    parser.add_argument("--images", default="./categoria/images", help="folder of the images of the csv")
+    parser.add_argument("--max-sides", type=int, nargs="+", default=[0, 2048, 1600, 1280, 1024, 800, 640])
+    parser.add_argument("--grayscale", action="store_true", help="also measure every size in grayscale")
+    parser.add_argument("--limit", type=int, default=None, help="max number of images")
+    parser.add_argument("--output", default=None, help="json file where the results are saved")
+    args = parser.parse_args()
+
+    references = load_reference_texts(args.data, args.images, args.limit)
+    if not references:
+        print(f"No se encontraron imágenes de {args.data} en {args.images}")
+        sys.exit(1)
+
+    reader = create_engine("easyocr")
+    # warmup, the first call of the reader loads the weights
+    reader.readtext(OCRPreprocess(640)(ImageSource(references[0][0])))
+
+    results = []
+    for max_side in args.max_sides:
+        for grayscale in ([False, True] if args.grayscale else [False]):
+            results.append(measure(reader, references, OCRPreprocess(max_side or None, grayscale)))
+            result = results[-1]
+            print(f"lado máximo: {result['max_side'] or 'original'} | gris: {result['grayscale']} | "
+                  f"{result['seconds_per_image']:.3f} s/imagen | similitud: {result['similarity']:.3f} | "
+                  f"palabras: {result['word_recall']:.3f}")
+
+    if args.output is not None:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
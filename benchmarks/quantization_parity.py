@@ -0,0 +1,76 @@
+"""
+Compare the int8 quantized model with the fp32 model over a held-out set
+
+Usage:
+    python benchmarks/quantization_parity.py topics --data final.csv
+    python benchmarks/quantization_parity.py classifier --data dataset.json
+
+The held-out set is the test split of the data loader used in training,
+run it from the folder that has the images of the dataset. The exit code
+is 1 when the agreement between both models is under --min-agreement.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from run import load_bert
+from src.quantization import check_parity, quantize_model
+
+
+def load_test_loader(architecture, data, batch_size):
+
+    """
+    Create the test split of the dataset of an architecture
+    """
+
+    if architecture == "topics":
+        from src.data_load.data_loader_category import load_split_data
+
+        _, test_loader, _ = load_split_data(data, batch_size=batch_size, BERT=True)
+        return test_loader
+
+    from src.data_load.data_loader import load_split_data
+
+    with open(data) as data_file:
+        dataset = json.load(data_file)
+    _, test_loader, _ = load_split_data(dataset, batch_size=batch_size, bert=True)
+    return test_loader
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Accuracy parity of the quantized model")
+    parser.add_argument("architecture", choices=["classifier", "topics"])
+    parser.add_argument("--data", required=True, help="csv of the topics or json of the classifier dataset")
+    parser.add_argument("--checkpoint", default=None, help="fp32 checkpoint, by default weight_models is used")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--min-agreement", type=float, default=0.99)
+    parser.add_argument("--output", default=None, help="json file where the results are saved")
+    args = parser.parse_args()
+
+    reference, _ = load_bert(args.architecture, args.checkpoint)
+    reference.eval()
+    candidate, _ = load_bert(args.architecture, args.checkpoint)
+    candidate = quantize_model(candidate)
+
+    loader = load_test_loader(args.architecture, args.data, args.batch_size)
+    results = check_parity(reference, candidate, loader, include_image=args.architecture == "classifier")
+
+    for key, value in results.items():
+        print(f"{key}: {value}")
+
+    if args.output is not None:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+
+    if results["agreement"] < args.min_agreement:
+        print(f"La concordancia {results['agreement']:.4f} es menor a {args.min_agreement}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
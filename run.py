@@ -1,11 +1,39 @@
-from src.classifier import process_data_bert
-from src.model import CNN, ModelMixBert, BertModelClassification
-from transformers import BertModel
-import sys
+from src.classifier import iter_process_data_bert, iter_process_data_cascade, iter_process_data_gated
+from src.checkpoint import build_bert_classifier, build_bert_topics, export_checkpoint, load_checkpoint
+from src.checkpoint import load_checkpoint_tokenizer
+from src.ocr.cache import OCRCache
+from src.ocr.gate import TextGate
+from src.ocr.preprocess import OCRPreprocess
+from src.ocr.text import OCRTextFilter
+from src.ocr.engines import OCR_ENGINES, create_engine
+from src.utils.result_writer import ResultWriter
+from src.utils.scanner import ImageScanner
+from src.utils.journal import JobJournal
+from src.utils.result_store import ResultStore
+from src.utils.relocator import ImageRelocator
+from src.utils.metrics import PipelineMetrics
+from src.profiling import StepProfiler
+from src.server import ClassifierServer, serve
+from src.engine import set_threads
+from src.quantization import is_quantized, quantize_model
+from src.onnx_backend import OnnxModel, export_onnx
+from src.gate import load_image_classifier
+import argparse
+import os
+import time
 import torch
-from transformers import logging
 
-logging.set_verbosity_error()
+CLASSES = ("Meme", "No Meme", "Sticker")
+
+TOPICS = (
+    "Human content",
+    "Politics",
+    "Other",
+    "Art and Culture",
+    "Sports",
+    "Weather",
+    "Political unrest",
+)
 
 
 def load_model(model_path):
@@ -30,11 +58,10 @@ def load_bert_classifier():
     :return: model
 
     """
+    from transformers import BertModel
+
     PATH = "./weight_models/bert_cnn"
-    model_text = BertModel.from_pretrained("bert-base-uncased")
-    model_text = BertModelClassification(model_text, 256)
-    model_image = CNN(256)
-    model = ModelMixBert(model_image, model_text, 512, 3)
+    model = build_bert_classifier(BertModel.from_pretrained("bert-base-uncased"))
     model.load_state_dict(torch.load(PATH))
     return model
 
@@ -48,59 +75,792 @@ def load_bert_topics():
     :return: model
 
     """
+    from transformers import BertModel
+
     PATH = "./weight_models/bert_7"
-    model = BertModel.from_pretrained("bert-base-uncased")
-    model = BertModelClassification(model, 7)
+    model = build_bert_topics(BertModel.from_pretrained("bert-base-uncased"))
     model.load_state_dict(torch.load(PATH))
     return model
 
 
-def predict(model, move, classes, show_info, include_image):
+def load_bert(architecture, checkpoint=None, mmap=True):
+    """
+    Load a Bert Model from a local checkpoint or from the weights of weight_models
+
+    :param architecture: "classifier" or "topics"
+    :param checkpoint: path of a checkpoint created with --export-checkpoint
+    :param mmap: if true, the weights of the checkpoint are memory mapped
+
+    :return: tuple (model, tokenizer), the tokenizer is None without checkpoint
+
+    """
+    if checkpoint is None:
+        if architecture == "classifier":
+            return load_bert_classifier(), None
+        return load_bert_topics(), None
+
+    model, bert_tokenizer, checkpoint_architecture = load_checkpoint(checkpoint, mmap=mmap)
+    if checkpoint_architecture != architecture:
+        raise ValueError(f"The checkpoint {checkpoint} is a {checkpoint_architecture} model, not {architecture}")
+    return model, bert_tokenizer
+
+
+def predict(model, move, classes, show_info, include_image, writer=None, profiler=None, **options):
 
     """
     Predict the images in the directory
 
     :param model: model
+    :param writer: ResultWriter where each result is appended as soon as it is ready
+    :param profiler: StepProfiler that records a window of batches
+    :param options: options of iter_process_data_bert (batch_size, max_length, ...)
+
+    :return: number of images classified
+
+    """
+    model.eval()
+    total = 0
+    if profiler is not None:
+        profiler.start()
+    try:
+        for path, classify in iter_process_data_bert(
+            model,
+            "./img_class",
+            classes,
+            move=move,
+            show_info=show_info,
+            include_image=include_image,
+            profiler=profiler,
+            **options,
+        ):
+            total += 1
+            if writer is not None:
+                writer.write({"path": path, "class": classify, "label": classes[classify]})
+    finally:
+        if profiler is not None:
+            profiler.stop()
+
+    return total
+
+
+def predict_cascade(classifier, topics, move, show_info, writer=None, **options):
+
+    """
+    Classify the images in the directory and the topic of the memes,
+    the ocr runs once per image
+
+    :param classifier: model of memes, no memes and stickers
+    :param topics: model of the topics of the memes
+    :param writer: ResultWriter where each result is appended as soon as it is ready
+    :param options: options of iter_process_data_cascade (batch_size, max_length, ...)
+
+    :return: number of images classified
+
+    """
+    classifier.eval()
+    topics.eval()
+    total = 0
+    for path, classify, topic in iter_process_data_cascade(
+        classifier,
+        topics,
+        "./img_class",
+        CLASSES,
+        TOPICS,
+        move=move,
+        show_info=show_info,
+        **options,
+    ):
+        total += 1
+        if writer is not None:
+            writer.write({
+                "path": path,
+                "class": classify,
+                "label": CLASSES[classify],
+                "topic": topic,
+                "topic_label": TOPICS[topic] if topic is not None else None,
+            })
+
+    return total
+
+
+def predict_gated(image_model, model, move, classes, show_info, threshold, writer=None, **options):
+
+    """
+    Predict the images in the directory, ocr and bert only run for the
+    images where the image only model is not confident
+
+    :param image_model: image only model
+    :param model: model
+    :param threshold: min probability to accept the prediction of the image model
+    :param writer: ResultWriter where each result is appended as soon as it is ready
+    :param options: options of iter_process_data_gated (batch_size, max_length, ...)
 
-    :return: list of tensors of the images with text
+    :return: dict with the number of images of each path ("image", "bert")
 
     """
     model.eval()
-    process_data_bert(
+    stats = {"image": 0, "bert": 0}
+    for path, classify in iter_process_data_gated(
+        image_model,
         model,
         "./img_class",
         classes,
+        threshold=threshold,
         move=move,
         show_info=show_info,
+        stats=stats,
+        **options,
+    ):
+        if writer is not None:
+            writer.write({"path": path, "class": classify, "label": classes[classify]})
+
+    return stats
+
+
+def load_backend(architecture, args, checkpoint=None, onnx_path=None):
+
+    """
+    Load a model with the backend selected in the arguments
+
+    :param architecture: "classifier" or "topics"
+    :param args: namespace with the arguments
+    :param checkpoint: path of a local checkpoint
+    :param onnx_path: onnx file used by the onnx backend
+
+    :return: tuple (model, tokenizer), the tokenizer is None if it is not in a checkpoint
+
+    """
+    if args.backend == "onnx":
+        model = OnnxModel(onnx_path, args.threads)
+        bert_tokenizer = None
+        if checkpoint is not None:
+            bert_tokenizer = load_checkpoint_tokenizer(checkpoint)
+        return model, bert_tokenizer
+
+    model, bert_tokenizer = load_bert(architecture, checkpoint, not args.no_mmap)
+    if args.quantize and not is_quantized(model):
+        model = quantize_model(model)
+    return model, bert_tokenizer
+
+
+def get_model_version(architecture, args, checkpoint=None, onnx_path=None):
+
+    """
+    Describe the model loaded with load_backend, saved with each result
+
+    :return: string with the architecture, backend and weights
+    """
+
+    weights = onnx_path if args.backend == "onnx" else checkpoint or "drive"
+    version = f"{architecture}:{args.backend}:{weights}"
+    if args.quantize and args.backend != "onnx":
+        version += ":int8"
+    return version
+
+
+def build_ocr_engine(args):
+
+    """
+    Create the ocr engine selected in the arguments
+
+    :param args: namespace with the arguments
+
+    :return: ocr engine
+    """
+
+    config = {}
+    if args.ocr_engine == "tesseract":
+        config["config"] = args.tesseract_config
+        if args.ocr_lang is not None:
+            config["lang"] = args.ocr_lang
+    elif args.ocr_lang is not None:
+        config["lang_list"] = args.ocr_lang.split(",")
+    return create_engine(args.ocr_engine, **config)
+
+
+def start_server(model, classes, include_image, args, ocr_cache=None, bert_tokenizer=None, text_gate=None,
+                 ocr_preprocess=None, ocr_text_filter=None, metrics=None):
+
+    """
+    Load the tokenizer and readers once and answer classification requests
+
+    :param model: model
+    :param args: namespace with the arguments of the server
+    :param bert_tokenizer: tokenizer of bert, by default bert-base-uncased
+    :param text_gate: TextGate that skips the ocr of images without text
+    :param ocr_preprocess: OCRPreprocess that downscales the image before the ocr
+    :param ocr_text_filter: OCRTextFilter that drops the noisy boxes of the ocr
+    :param metrics: PipelineMetrics where the seconds of each request are added
+
+    """
+    from transformers import BertTokenizer
+
+    if bert_tokenizer is None:
+        bert_tokenizer = BertTokenizer.from_pretrained("bert-base-uncased")
+    readers = [build_ocr_engine(args) for _ in range(args.ocr_readers)]
+    for reader in readers:
+        reader.load()
+    app = ClassifierServer(
+        model,
+        classes,
+        bert_tokenizer,
+        readers,
         include_image=include_image,
+        batch_size=args.batch_size,
+        max_latency=args.max_latency / 1000,
+        max_length=args.max_length,
+        ocr_cache=ocr_cache,
+        text_gate=text_gate,
+        ocr_preprocess=ocr_preprocess,
+        ocr_text_filter=ocr_text_filter,
+        metrics=metrics,
+        root=args.serve_root or None,
+        max_body_size=int(args.max_body_size * 2**20),
+    )
+    app.warmup()
+    serve(app, args.host, args.port)
+
+
+def parse_args():
+    """
+    Parse the command line arguments
+
+    :return: namespace with the arguments
+
+    """
+    parser = argparse.ArgumentParser(description="Meme classifier")
+    parser.add_argument("model_name")
+    parser.add_argument("mode_classifier")
+    parser.add_argument("move_image")
+    parser.add_argument("show_info")
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1,
+        help="number of images per forward pass",
+    )
+    parser.add_argument(
+        "--max-length",
+        type=int,
+        default=512,
+        help="max number of tokens of the text, 16 matches the training datasets",
+    )
+    parser.add_argument(
+        "--bucket-size",
+        type=int,
+        default=8,
+        help="number of batches that are sorted together by token length",
     )
+    parser.add_argument(
+        "--ocr-cache",
+        default=None,
+        help="path of the sqlite database used to cache the ocr results",
+    )
+    parser.add_argument(
+        "--ocr-cache-size",
+        type=int,
+        default=100000,
+        help="max number of images saved in the ocr cache",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        help="number of processes used for the ocr, 0 runs it in the main process",
+    )
+    parser.add_argument(
+        "--queue-depth",
+        type=int,
+        default=16,
+        help="max number of images prepared ahead of the model",
+    )
+    parser.add_argument(
+        "--output",
+        default=None,
+        help="jsonl or csv file where the results are appended while classifying",
+    )
+    parser.add_argument(
+        "--flush-every",
+        type=int,
+        default=100,
+        help="number of results buffered before writing them to the output",
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="keep the model loaded and classify images received by http",
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="address of the server")
+    parser.add_argument("--port", type=int, default=8000, help="port of the server")
+    parser.add_argument(
+        "--max-latency",
+        type=float,
+        default=10,
+        help="milliseconds a request waits for its micro-batch to fill",
+    )
+    parser.add_argument(
+        "--serve-root",
+        default="./img_class",
+        help='directory of the images that the server classifies by path, "" only accepts uploaded images',
+    )
+    parser.add_argument(
+        "--max-body-size",
+        type=float,
+        default=20,
+        help="max megabytes of the body of a request to the server",
+    )
+    parser.add_argument(
+        "--ocr-readers",
+        type=int,
+        default=1,
+        help="number of ocr engines shared by the requests of the server",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        default=None,
+        help="local checkpoint with the config, vocab and weights of the model",
+    )
+    parser.add_argument(
+        "--no-mmap",
+        action="store_true",
+        help="read the whole checkpoint in memory instead of memory mapping it",
+    )
+    parser.add_argument(
+        "--export-checkpoint",
+        default=None,
+        help="save the loaded model as a local checkpoint and exit",
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=None,
+        help="threads used by torch inside each operator",
+    )
+    parser.add_argument(
+        "--interop-threads",
+        type=int,
+        default=None,
+        help="threads used by torch to run operators in parallel",
+    )
+    parser.add_argument(
+        "--quantize",
+        action="store_true",
+        help="apply dynamic int8 quantization to the linear layers of the model",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=["torch", "onnx"],
+        default="torch",
+        help="run the model with pytorch or with onnxruntime",
+    )
+    parser.add_argument(
+        "--onnx-path",
+        default=None,
+        help="onnx file used by the onnx backend",
+    )
+    parser.add_argument(
+        "--export-onnx",
+        default=None,
+        help="save the loaded model as an onnx file and exit",
+    )
+    parser.add_argument(
+        "--topics-checkpoint",
+        default=None,
+        help="local checkpoint of the topics model used by mode 3",
+    )
+    parser.add_argument(
+        "--topics-onnx-path",
+        default=None,
+        help="onnx file of the topics model used by mode 3 with the onnx backend",
+    )
+    parser.add_argument(
+        "--image-model",
+        default=None,
+        help="weights of the image only model that runs before the ocr in mode 1",
+    )
+    parser.add_argument(
+        "--image-threshold",
+        type=float,
+        default=0.9,
+        help="min probability of the image only model to skip the ocr and bert",
+    )
+    parser.add_argument(
+        "--text-gate",
+        action="store_true",
+        help="run first a text detection on a reduced image and skip the ocr of images without text",
+    )
+    parser.add_argument(
+        "--text-gate-size",
+        type=int,
+        default=640,
+        help="max size in pixels of the longest side of the image given to the detection of --text-gate",
+    )
+    parser.add_argument(
+        "--ocr-max-side",
+        type=int,
+        default=None,
+        help="max size in pixels of the longest side of the image given to the ocr",
+    )
+    parser.add_argument(
+        "--ocr-grayscale",
+        action="store_true",
+        help="convert the image to grayscale before the ocr",
+    )
+    parser.add_argument(
+        "--ocr-min-confidence",
+        type=float,
+        default=None,
+        help="drop the ocr boxes under this confidence, the boxes are also sorted in reading order and deduplicated",
+    )
+    parser.add_argument(
+        "--ocr-max-words",
+        type=int,
+        default=None,
+        help="max number of words of the ocr text given to bert",
+    )
+    parser.add_argument(
+        "--ocr-engine",
+        choices=list(OCR_ENGINES),
+        default="easyocr",
+        help="engine used for the ocr",
+    )
+    parser.add_argument(
+        "--ocr-lang",
+        default=None,
+        help="languages of the ocr, en by default for easyocr (comma separated) and eng for tesseract (eng+spa)",
+    )
+    parser.add_argument(
+        "--tesseract-config",
+        default="",
+        help="extra options of tesseract, for example \"--psm 6\"",
+    )
+    parser.add_argument(
+        "--no-recursive",
+        action="store_true",
+        help="only classify the images of ./img_class, not the images of its subfolders",
+    )
+    parser.add_argument(
+        "--check-magic",
+        action="store_true",
+        help="check the first bytes of each file, not only the extension, before classifying it",
+    )
+    parser.add_argument(
+        "--sort-by-size",
+        type=int,
+        default=None,
+        metavar="CHUNK",
+        help="sort the images by file size in chunks of this number of paths",
+    )
+    parser.add_argument(
+        "--journal",
+        default=None,
+        help="sqlite file with the progress of the job, the images already classified are skipped when it is run again",
+    )
+    parser.add_argument(
+        "--quarantine",
+        default=None,
+        help="folder where the images that fail are moved, only with --journal",
+    )
+    parser.add_argument(
+        "--retry-failed",
+        action="store_true",
+        help="process again the images that failed in a previous run of the journal",
+    )
+    parser.add_argument(
+        "--results",
+        default=None,
+        help="sqlite file where the probabilities, ocr text and timings of each image are saved",
+    )
+    parser.add_argument(
+        "--run-id",
+        default=None,
+        help="name of the run in the --results file, by default the date and time",
+    )
+    parser.add_argument(
+        "--move-dir",
+        default=".",
+        help="folder where the folder of each class is created when the images are moved",
+    )
+    parser.add_argument(
+        "--move-workers",
+        type=int,
+        default=0,
+        help="number of threads that move the images, useful on network mounts",
+    )
+    parser.add_argument(
+        "--move-batch",
+        type=int,
+        default=64,
+        help="number of images moved together",
+    )
+    parser.add_argument(
+        "--move-manifest",
+        default=None,
+        help="jsonl file where the moves are saved, they are undone with python -m src.utils.relocator FILE",
+    )
+    parser.add_argument(
+        "--metrics",
+        default=None,
+        help="json file where the seconds of each stage, images per second and peak memory are saved",
+    )
+    parser.add_argument(
+        "--metrics-prometheus",
+        default=None,
+        help="file where the metrics are written in the text format of Prometheus while running",
+    )
+    parser.add_argument(
+        "--metrics-interval",
+        type=float,
+        default=15.0,
+        help="seconds between two writes of --metrics-prometheus",
+    )
+    parser.add_argument(
+        "--profile",
+        default=None,
+        metavar="DIR",
+        help="profile a window of batches with torch.profiler and save the chrome traces in this folder",
+    )
+    parser.add_argument(
+        "--profile-wait",
+        type=int,
+        default=1,
+        help="batches skipped before the profiled window",
+    )
+    parser.add_argument(
+        "--profile-warmup",
+        type=int,
+        default=1,
+        help="batches profiled and discarded before the recorded ones",
+    )
+    parser.add_argument(
+        "--profile-steps",
+        type=int,
+        default=3,
+        help="batches recorded by the profiler",
+    )
+    parser.add_argument(
+        "--profile-tensorboard",
+        action="store_true",
+        help="also save the output of the tensorboard profiler in DIR/tensorboard",
+    )
+    parser.add_argument(
+        "--profile-sort",
+        default="self_cpu_time_total",
+        help="column used to sort the table of operators, for example self_cpu_memory_usage",
+    )
+    args = parser.parse_args()
+    if args.backend == "onnx" and args.quantize:
+        parser.error("--quantize solo se puede usar con --backend torch")
+    if args.backend == "onnx" and args.export_checkpoint is not None:
+        parser.error("--export-checkpoint necesita el modelo de pytorch, no se puede usar con --backend onnx")
+    if args.backend == "onnx" and args.export_onnx is not None:
+        parser.error("--export-onnx necesita el modelo de pytorch, no se puede usar con --backend onnx")
+    if args.serve:
+        # the server only answers requests, the options of a directory job have no effect
+        ignored = [name for name, used in (
+            ("move_image true", args.move_image == "true"),
+            ("--output", args.output is not None),
+            ("--journal", args.journal is not None),
+            ("--results", args.results is not None),
+            ("--image-model", args.image_model is not None),
+            ("--profile", args.profile is not None),
+            ("--workers", args.workers > 0),
+        ) if used]
+        if ignored:
+            parser.error(f"--serve no se puede usar con {', '.join(ignored)}")
+    if args.text_gate_size < 1:
+        parser.error("--text-gate-size debe ser mayor que 0")
+    return args
 
 
 if __name__ == "__main__":
 
-    model_name = sys.argv[1]
-    mode_classifier = sys.argv[2]
-    move_image = True if sys.argv[3] == "true" else False
-    show_info = bool(sys.argv[4])
+    args = parse_args()
+
+    from transformers import BertTokenizer, logging
+
+    logging.set_verbosity_error()
+    set_threads(args.threads, args.interop_threads)
+    model_name = args.model_name
+    mode_classifier = args.mode_classifier
+    move_image = True if args.move_image == "true" else False
+    show_info = bool(args.show_info)
 
     print("Cargando modelo..")
+    cascade = False
     if model_name == "bert" and int(mode_classifier) == 1:
-        classes = ("Meme", "No Meme", "Sticker")
-        model = load_bert_classifier()
+        classes = CLASSES
+        architecture = "classifier"
         include_image = True
 
     elif model_name == "bert" and int(mode_classifier) == 2:
-        classes = (
-            "Human content",
-            "Politics",
-            "Other",
-            "Art and Culture",
-            "Sports",
-            "Weather",
-            "Political unrest",
-        )
-        model = load_bert_topics()
+        classes = TOPICS
+        architecture = "topics"
         include_image = False
+        if args.image_model is not None:
+            raise SystemExit("--image-model solo se puede usar en el modo 1")
+
+    elif model_name == "bert" and int(mode_classifier) == 3:
+        classes = CLASSES
+        architecture = "classifier"
+        include_image = True
+        cascade = True
+        if args.image_model is not None:
+            raise SystemExit("--image-model solo se puede usar en el modo 1")
+        if args.profile is not None:
+            raise SystemExit("--profile solo se puede usar en los modos 1 y 2")
+        if args.serve or args.export_checkpoint is not None or args.export_onnx is not None:
+            raise SystemExit("El modo 3 no se puede servir ni exportar, usar los modos 1 y 2")
+
+    if args.profile is not None and args.image_model is not None:
+        raise SystemExit("--profile no se puede usar con --image-model")
+
+    load_start = time.perf_counter()
+    model, bert_tokenizer = load_backend(architecture, args, args.checkpoint, args.onnx_path)
+    if cascade:
+        topics, _ = load_backend("topics", args, args.topics_checkpoint, args.topics_onnx_path)
+
+    metrics = None
+    if args.metrics is not None or args.metrics_prometheus is not None:
+        metrics = PipelineMetrics(args.metrics_prometheus, args.metrics_interval)
+        metrics.observe("load_model", time.perf_counter() - load_start)
+
+    ocr_cache = None
+    if args.ocr_cache is not None:
+        ocr_cache = OCRCache(args.ocr_cache, max_entries=args.ocr_cache_size)
+
+    text_gate = TextGate(args.text_gate_size) if args.text_gate else None
+
+    ocr_preprocess = None
+    if args.ocr_max_side is not None or args.ocr_grayscale:
+        ocr_preprocess = OCRPreprocess(args.ocr_max_side, args.ocr_grayscale)
+
+    ocr_text_filter = None
+    if args.ocr_min_confidence is not None or args.ocr_max_words is not None:
+        ocr_text_filter = OCRTextFilter(args.ocr_min_confidence or 0.0, max_words=args.ocr_max_words)
+
+    if args.export_checkpoint is not None:
+        if bert_tokenizer is None:
+            bert_tokenizer = BertTokenizer.from_pretrained("bert-base-uncased")
+        export_checkpoint(model, bert_tokenizer, architecture, args.export_checkpoint)
+        print(f"Checkpoint guardado en {args.export_checkpoint}")
+
+    elif args.export_onnx is not None:
+        export_onnx(model, args.export_onnx, include_image)
+        print(f"Modelo onnx guardado en {args.export_onnx}")
+
+    elif args.serve:
+        start_server(model, classes, include_image, args, ocr_cache, bert_tokenizer, text_gate, ocr_preprocess,
+                     ocr_text_filter, metrics)
+
+    else:
+        writer = None
+        if args.output is not None:
+            writer = ResultWriter(args.output, flush_every=args.flush_every)
+
+        journal = None
+        if args.journal is not None:
+            journal = JobJournal(args.journal, args.quarantine, args.retry_failed)
+
+        relocator = None
+        if move_image:
+            relocator = ImageRelocator(classes, args.move_dir, args.move_manifest, args.move_workers,
+                                       args.move_batch, metrics)
+
+        results = None
+        if args.results is not None:
+            model_version = get_model_version(architecture, args, args.checkpoint, args.onnx_path)
+            if cascade:
+                model_version += " " + get_model_version("topics", args, args.topics_checkpoint,
+                                                         args.topics_onnx_path)
+            results = ResultStore(args.results, classes, model_version, args.run_id,
+                                  TOPICS if cascade else None, flush_every=args.flush_every)
+
+        options = dict(
+            batch_size=args.batch_size,
+            max_length=args.max_length,
+            bucket_size=args.bucket_size,
+            ocr_cache=ocr_cache,
+            workers=args.workers,
+            queue_depth=args.queue_depth,
+            bert_tokenizer=bert_tokenizer,
+            text_gate=text_gate,
+            ocr_preprocess=ocr_preprocess,
+            ocr_text_filter=ocr_text_filter,
+            ocr_engine=build_ocr_engine(args),
+            scanner=ImageScanner(
+                recursive=not args.no_recursive,
+                check_magic=args.check_magic,
+                sort_by_size=args.sort_by_size is not None,
+                chunk_size=args.sort_by_size or 1024,
+            ),
+            journal=journal,
+            results=results,
+            relocator=relocator,
+            metrics=metrics,
+        )
+
+        print("Prediciendo...")
+        try:
+            if cascade:
+                predict_cascade(model, topics, move_image, show_info, writer=writer, **options)
+            elif args.image_model is not None:
+                image_model = load_image_classifier(args.image_model, len(classes))
+                stats = predict_gated(image_model, model, move_image, classes, show_info, args.image_threshold,
+                                      writer=writer, **options)
+                total = max(stats["image"] + stats["bert"], 1)
+                print(f"Solo imagen: {stats['image']} ({stats['image'] / total:.1%}), "
+                      f"OCR + Bert: {stats['bert']} ({stats['bert'] / total:.1%})")
+            else:
+                profiler = None
+                if args.profile is not None:
+                    profiler = StepProfiler(
+                        args.profile,
+                        wait=args.profile_wait,
+                        warmup=args.profile_warmup,
+                        active=args.profile_steps,
+                        tensorboard_dir=os.path.join(args.profile, "tensorboard") if args.profile_tensorboard else None,
+                        sort_by=args.profile_sort,
+                        name="predict",
+                    )
+                predict(model, move_image, classes, show_info, include_image, writer=writer, profiler=profiler,
+                        **options)
+        finally:
+            # the results classified before an error are kept for the next run
+            if writer is not None:
+                writer.close()
+            if relocator is not None:
+                relocator.close()
+                stats = relocator.get_stats()
+                print(f"Imágenes movidas: {stats['moved']}, sin mover por error: {stats['failed']}")
+            if results is not None:
+                results.close()
+                print(f"Resultados guardados en {args.results} con el id {results.run_id}")
+            if journal is not None:
+                stats = journal.get_stats()
+                print(f"Registro: {stats['skipped']} imágenes ya procesadas omitidas, {stats['recorded']} "
+                      f"clasificadas, {stats['failed']} con error, {stats['resumed_moves']} movimientos retomados")
+                journal.close()
+
+    if ocr_cache is not None:
+        stats = ocr_cache.get_stats()
+        print(f"Cache OCR: {stats['hits']} aciertos, {stats['misses']} fallos")
+        ocr_cache.close()
+
+    if text_gate is not None:
+        stats = text_gate.get_stats()
+        print(f"Detección de texto: {stats['skipped']} de {stats['checked']} imágenes sin texto")
+
+    if ocr_text_filter is not None:
+        stats = ocr_text_filter.get_stats()
+        print(f"Filtro del OCR: {stats['tokens_saved_per_image']:.1f} tokens de Bert ahorrados por imagen")
 
-    print("Prediciendo...")
-    predict(model, move_image, classes, show_info, include_image)
+    if metrics is not None:
+        summary = metrics.write_json(args.metrics) if args.metrics is not None else metrics.get_summary()
+        if args.metrics_prometheus is not None:
+            metrics.write_prometheus()
+        memory = f"{summary['peak_rss_mb']:.0f} MB" if summary["peak_rss_mb"] is not None else "no disponible"
+        print(f"{summary['images_per_second']:.2f} imágenes por segundo, memoria máxima: {memory}")
+        for stage, stats in summary["stages"].items():
+            print(f"  {stage}: p50 {stats['p50'] * 1000:.1f} ms, p95 {stats['p95'] * 1000:.1f} ms, "
+                  f"p99 {stats['p99'] * 1000:.1f} ms")
@@ -0,0 +1,167 @@
+import os
+import tempfile
+
+import torch
+
+from src.model import CNN, ModelMixBert, BertModelClassification
+from src.quantization import is_quantized, quantize_model
+
+
+def build_bert_classifier(bert):
+
+    """
+    Create the model that classifies memes, no memes and stickers
+
+    :param bert: BertModel used for the text
+
+    :return: ModelMixBert
+    """
+
+    model_text = BertModelClassification(bert, 256)
+    model_image = CNN(256)
+    return ModelMixBert(model_image, model_text, 512, 3)
+
+
+def build_bert_topics(bert):
+
+    """
+    Create the model that classifies the topic of a meme
+
+    :param bert: BertModel used for the text
+
+    :return: BertModelClassification
+    """
+
+    return BertModelClassification(bert, 7)
+
+
+ARCHITECTURES = {
+    "classifier": build_bert_classifier,
+    "topics": build_bert_topics,
+}
+
+
+def export_checkpoint(model, bert_tokenizer, architecture: str, path: str) -> None:
+
+    """
+    Save a self contained checkpoint with the config of bert, the vocab of
+    the tokenizer and every weight of the model, quantized models are saved
+    with their int8 weights
+
+    :param model: model created with one of ARCHITECTURES
+    :param bert_tokenizer: tokenizer of bert used by the model
+    :param architecture: key of ARCHITECTURES
+    :param path: path of the checkpoint
+    """
+
+    bert = model.bert.bert if architecture == "classifier" else model.bert
+    vocab = sorted(bert_tokenizer.vocab.items(), key=lambda item: item[1])
+
+    torch.save({
+        "architecture": architecture,
+        "bert_config": bert.config.to_dict(),
+        "vocab": [token for token, _ in vocab],
+        "do_lower_case": bert_tokenizer.do_lower_case,
+        "quantized": is_quantized(model),
+        "state_dict": model.state_dict(),
+    }, path)
+
+
+def load_checkpoint(path: str, mmap: bool = True) -> tuple:
+
+    """
+    Load a checkpoint created with export_checkpoint
+
+    The model is created in the meta device and the weights of the
+    checkpoint are assigned to it, so they are only materialized once
+    (and read lazily from disk when mmap is true). No network is needed.
+    Quantized checkpoints are loaded into an empty quantized model instead.
+
+    :param path: path of the checkpoint
+    :param mmap: if true, the tensors are memory mapped from the file
+
+    :return: tuple (model, tokenizer, architecture)
+    """
+
+    from transformers import BertConfig, BertModel
+
+    checkpoint = torch.load(path, map_location="cpu", mmap=mmap, weights_only=True)
+    config = BertConfig.from_dict(checkpoint["bert_config"])
+
+    with torch.device("meta"):
+        model = ARCHITECTURES[checkpoint["architecture"]](BertModel(config))
+
+    if checkpoint.get("quantized", False):
+        model = model.to_empty(device="cpu")
+        for parameter in model.parameters():
+            parameter.data.zero_()
+        _init_buffers(model, config)
+        model = quantize_model(model)
+        model.load_state_dict(checkpoint["state_dict"])
+
+    else:
+        model.load_state_dict(checkpoint["state_dict"], assign=True)
+        _init_buffers(model, config)
+
+    bert_tokenizer = load_tokenizer(checkpoint["vocab"], checkpoint["do_lower_case"],
+                                    config.max_position_embeddings)
+    return model, bert_tokenizer, checkpoint["architecture"]
+
+
+def load_checkpoint_tokenizer(path: str):
+
+    """
+    Load only the tokenizer of a checkpoint created with export_checkpoint
+
+    :param path: path of the checkpoint
+
+    :return: BertTokenizer
+    """
+
+    checkpoint = torch.load(path, map_location="cpu", mmap=True, weights_only=True)
+    return load_tokenizer(checkpoint["vocab"], checkpoint["do_lower_case"],
+                          checkpoint["bert_config"]["max_position_embeddings"])
+
+
+def load_tokenizer(vocab: list, do_lower_case: bool = True, max_length: int = 512):
+
+    """
+    Create a BertTokenizer from the vocab saved in a checkpoint
+
+    :param vocab: list of tokens ordered by id
+    :param do_lower_case: if true, the text is lower cased
+    :param max_length: max number of tokens of the model
+
+    :return: BertTokenizer
+    """
+
+    from transformers import BertTokenizer
+
+    vocab_file = tempfile.NamedTemporaryFile("w", suffix=".txt", encoding="utf-8", delete=False)
+    try:
+        vocab_file.write("\n".join(vocab) + "\n")
+        vocab_file.close()
+        return BertTokenizer(vocab_file.name, do_lower_case=do_lower_case, model_max_length=max_length)
+    finally:
+        os.remove(vocab_file.name)
+
+
+def _init_buffers(model, config) -> None:
+
+    """
+    Create the buffers of bert that are not saved in the state dict
+    """
+    from transformers import BertModel
+
+    for module in model.modules():
+        if isinstance(module, BertModel):
+            embeddings = module.embeddings
+            size = config.max_position_embeddings
+            if getattr(embeddings, "position_ids", None) is not None:
+                embeddings.position_ids = torch.arange(size).expand((1, -1))
+            if getattr(embeddings, "token_type_ids", None) is not None:
+                embeddings.token_type_ids = torch.zeros((1, size), dtype=torch.long)
+
+    for name, tensor in list(model.named_parameters()) + list(model.named_buffers()):
+        if tensor.is_meta:
+            raise RuntimeError(f"{name} was not found in the checkpoint")
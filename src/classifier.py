@@ -1,42 +1,115 @@
 import torch
-import easyocr
 
 
 from src.tokenizers.tokenizer import TokenizerMeme
-from PIL import Image
-from torchvision import transforms
-from pathlib import Path
-from transformers import BertTokenizer, PreTrainedTokenizerFast, AutoTokenizer
-import os
+from torch.nn.utils.rnn import pad_sequence
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from contextlib import contextmanager
+from src.ocr.cache import OCRCache
+from src.ocr.gate import TextGate
+from src.ocr.text import estimate_tokens, join_text
+from src.ocr.engines import create_engine
+from src.utils.image_source import ImageSource
+from src.utils.scanner import ImageScanner
+from src.utils.journal import describe_error
+from src.utils.relocator import ImageRelocator
+from src.engine import InferenceEngine
+from src.gate import iter_image_gate
+import time
+import multiprocessing
 
-import numpy as np
-import cv2
-import tempfile
 
+# easyocr, torchvision and transformers are imported where they are used,
+# importing them takes longer than most short classification jobs
 
-def get_files_from_directory(path):
+# classes of the model of memes, no memes and stickers
+DEFAULT_CLASSES = ("Meme", "No Meme", "Sticker")
+
+
+def get_files_from_directory(path, scanner=None):
     
     """"
-    Get all paths of files in a directory
+    Get all paths of images in a directory
     
     :param path: path of the directory
+    :param scanner: ImageScanner used to find the images, by default recursive
     
     :return: iterator of paths
     
     """
     
-    file_path = Path(path)
-    iterator = file_path.iterdir()
-    return iterator
+    if scanner is None:
+        scanner = ImageScanner()
+    return scanner(path)
+
+
+def get_reader_config(reader):
+    
+    """
+    Get the configuration of a reader, used as part of the key of the ocr cache
+    
+    :param reader: ocr engine or reader of easyocr
+    
+    :return: dict with the configuration
+    
+    """
+    
+    if hasattr(reader, "get_config"):
+        return reader.get_config()
+    
+    return {
+        "reader": type(reader).__name__,
+        "lang_list": list(getattr(reader, "lang_list", [])),
+    }
 
 
-def recognize_text(img_path, reader):
+def readtext(img_path, reader, text_gate=None):
+    
+    """
+    Run the reader over an image, through the text gate if there is one
+    
+    :param img_path: path of the image or RGB array
+    :param reader: ocr engine or reader of easyocr
+    :param text_gate: TextGate that skips the ocr of images without text
+    
+    :return: list of recognized text
+    
+    """
+    
+    if text_gate is None:
+        return reader.readtext(img_path)
+    return text_gate.readtext(reader, img_path)
+
+
+def get_ocr_input(source, ocr_preprocess=None):
+    
+    """
+    Decode the image that is given to the ocr
+    
+    :param source: ImageSource of the image
+    :param ocr_preprocess: OCRPreprocess that downscales the image before the ocr
+    
+    :return: numpy array of the image
+    
+    """
+    
+    if ocr_preprocess is None:
+        return source.array
+    return ocr_preprocess(source)
+
+
+def recognize_text(img_path, reader, cache=None, text_gate=None, ocr_preprocess=None):
     
     """
     Recognize text from an image
     
-    :param img_path: path of the image
-    :reader: reader of easyocr
+    :param img_path: path of the image or ImageSource, the image is only
+                     decoded if the text is not in the cache
+    :reader: ocr engine or reader of easyocr
+    :param cache: OCRCache to reuse the text of images already processed
+    :param text_gate: TextGate that skips the ocr of images without text
+    :param ocr_preprocess: OCRPreprocess that downscales the image before the ocr
     
     :return: list of recognized text
     
@@ -49,24 +122,36 @@ def recognize_text(img_path, reader):
     #_, im = cv2.threshold(im, 240, 255, 1)
     
     
-    text = reader.readtext(img_path)
+    source = get_image_source(img_path)
+    if cache is None:
+        return readtext(get_ocr_input(source, ocr_preprocess), reader, text_gate)
+    
+    config = get_reader_config(reader)
+    if ocr_preprocess is not None:
+        config.update(ocr_preprocess.get_config())
+    key = cache.make_key(source.data, config)
+    text = cache.get(key)
+    if text is None:
+        text = readtext(get_ocr_input(source, ocr_preprocess), reader, text_gate)
+        cache.put(key, text)
     return text
 
 
-def image_to_text(image_path, vocab, reader, tokenizer):
+def image_to_text(image_path, vocab, reader, tokenizer, cache=None):
     
     """
     Transform a image to text
     
-    :param image_path: path of the image
+    :param image_path: path of the image or ImageSource
     :param vocab: vocabulary of the text
-    :param reader: reader of easyocr
+    :param reader: ocr engine or reader of easyocr
+    :param cache: OCRCache to reuse the text of images already processed
     
     :return: tensor of the text
     
     """
     
-    text_predict = recognize_text(image_path, reader)
+    text_predict = recognize_text(image_path, reader, cache)
     text_tensor = [1]
     
     for element in text_predict:
@@ -83,170 +168,882 @@ def image_to_text(image_path, vocab, reader, tokenizer):
 def load_image(image_path):
     
     """
-    Load a image from a path
+    Load a image from a path, jpeg images are decoded in a reduced size over 112x112
     
-    :param image_path: path of the image
+    :param image_path: path of the image or ImageSource
     
     :return: Tensor of the image
     
     """
     
-    train_transforms = transforms.Compose([transforms.Resize((56, 56)),
-                                            transforms.ToTensor(),
-                                            transforms.Normalize((0.485, 0.456, 0.406), (0.229, 0.224, 0.225))])
+    return get_image_source(image_path).tensor()
 
-    image = Image.open(image_path).convert("RGB")    
-    image = train_transforms(image)
-    image = [image]
-    image = torch.stack(image)
-    return image
 
-def process_data(vocab, model, init_directory, move=False):
+def get_image_source(image_path):
     
     """
-    Process all images in a directory
+    Wrap a path in an ImageSource, so the image is read and decoded once
+    
+    :param image_path: path of the image or ImageSource
+    
+    :return: ImageSource
+    
+    """
+    
+    if isinstance(image_path, ImageSource):
+        return image_path
+    return ImageSource(image_path)
+
+def iter_process_data(vocab, model, init_directory, move=False, ocr_cache=None, ocr_engine=None, scanner=None,
+                      classes=DEFAULT_CLASSES, relocator=None):
+    
+    """
+    Process all images in a directory, yielding each result as soon as it is ready
     
     :param vocab: vocabulary of the text
+    :param ocr_cache: OCRCache to reuse the text of images already processed
+    :param ocr_engine: engine used for the ocr, by default easyocr in english
+    :param scanner: ImageScanner used to find the images of the directory
+    :param classes: tuple with the name of the classes, used for the folders of the moved images
+    :param relocator: ImageRelocator used when move is true
     
-    :return: list of tensors of the images with text
+    :return: iterator of tuples (path, class)
     
     """
     
-    results = []
     tokenizer = TokenizerMeme(vocab)
-    reader = easyocr.Reader(['en'])
-    iter_image = get_files_from_directory(init_directory)
-    for image in iter_image:
-        text_tensor = image_to_text(str(image), vocab, reader, tokenizer)
-        image_loaded = load_image(str(image))
-        predict = model.forward(image_loaded, text_tensor)
-        val, ind = predict.squeeze(1).max(1)
-        results.append((str(image), ind.item()))
-        if move:
-            move_image(str(image), ind.item())
-        
-    return results
+    reader = ocr_engine if ocr_engine is not None else create_engine()
+    iter_image = get_files_from_directory(init_directory, scanner)
+    with run_relocator(move, classes, relocator) as relocator:
+        for image in iter_image:
+            source = ImageSource(image)
+            text_tensor = image_to_text(source, vocab, reader, tokenizer, ocr_cache)
+            image_loaded = load_image(source)
+            with torch.inference_mode():
+                predict = model.forward(image_loaded, text_tensor)
+            val, ind = predict.squeeze(1).max(1)
+            if relocator is not None:
+                relocator.move(str(image), ind.item())
+            yield str(image), ind.item()
+
+
+def process_data(vocab, model, init_directory, move=False, ocr_cache=None, ocr_engine=None, scanner=None):
+    
+    """
+    Process all images in a directory
+    
+    :param vocab: vocabulary of the text
+    :param ocr_cache: OCRCache to reuse the text of images already processed
+    
+    :return: list of tuples (path, class)
+    
+    """
+    
+    return list(iter_process_data(vocab, model, init_directory, move, ocr_cache, ocr_engine, scanner))
 
-def image_to_text_bert(image_path, reader):
+def image_to_text_bert(image_path, reader, cache=None, text_gate=None, ocr_preprocess=None, ocr_text_filter=None):
     
     """
     Transform a image to text
     
-    :param image_path: path of the image
+    :param image_path: path of the image or ImageSource
     :param vocab: vocabulary of the text
-    :param reader: reader of easyocr
+    :param reader: ocr engine or reader of easyocr
+    :param cache: OCRCache to reuse the text of images already processed
+    :param text_gate: TextGate that skips the ocr of images without text
+    :param ocr_preprocess: OCRPreprocess that downscales the image before the ocr
+    :param ocr_text_filter: OCRTextFilter that drops the noisy boxes of the ocr
     
     :return: tensor of the text
     
     """
 
-    text_predict = recognize_text(image_path, reader)
-    text = ""
+    text_predict = recognize_text(image_path, reader, cache, text_gate, ocr_preprocess)
+    if ocr_text_filter is not None:
+        return ocr_text_filter(text_predict)
+    return join_text(text_predict)
+
+def prepare_sample_bert(image_path, reader, bert_tokenizer, max_length=512, cache=None, text_gate=None,
+                        ocr_preprocess=None, ocr_text_filter=None):
     
-    for element in text_predict:
+    """
+    Run OCR, tokenization and image loading for a single image
+    The text is not padded, padding is done per batch in predict_batch
+    
+    :param image_path: path of the image or ImageSource
+    :param reader: ocr engine or reader of easyocr
+    :param bert_tokenizer: tokenizer of bert
+    :param max_length: max number of tokens of the text
+    :param cache: OCRCache to reuse the text of images already processed
+    :param text_gate: TextGate that skips the ocr of images without text
+    :param ocr_preprocess: OCRPreprocess that downscales the image before the ocr
+    :param ocr_text_filter: OCRTextFilter that drops the noisy boxes of the ocr
+    
+    :return: dict with the path, hash of the file, text, token ids, attention
+             mask, image tensor, if the image has text, the seconds of each
+             stage and, with ocr_text_filter, the number of tokens of the
+             text before (estimated) and after the filter
+    
+    """
+    
+    start = time.perf_counter()
+    source = get_image_source(image_path)
+    ocr_tokens = None
+    if ocr_text_filter is None:
+        text_image = image_to_text_bert(source, reader, cache, text_gate, ocr_preprocess)
+    else:
+        text_predict = recognize_text(source, reader, cache, text_gate, ocr_preprocess)
+        text_image = ocr_text_filter(text_predict)
+    ocr_end = time.perf_counter()
+    encoded = bert_tokenizer.encode_plus(
+        text=text_image,
+        add_special_tokens=True,
+        max_length = max_length,
+        return_attention_mask = True,
+        return_tensors='pt',
+        truncation=True
+    )
+    if ocr_text_filter is not None:
+        # the tokens of the text without [CLS] and [SEP], the raw text is not tokenized
+        tokens = encoded['input_ids'].shape[1] - 2
+        ocr_tokens = (estimate_tokens(join_text(text_predict), text_image, tokens, max_length - 2), tokens)
+    tokenize_end = time.perf_counter()
+    image = source.tensor()
+    
+    return {
+        "path": source.path,
+        "sha256": source.sha256,
+        "text": text_image,
+        "input_ids": encoded['input_ids'].flatten(),
+        "mask": encoded['attention_mask'].flatten(),
+        "image": image,
+        "has_text": bool(text_image.strip()),
+        "ocr_tokens": ocr_tokens,
+        "timings": {
+            "ocr": ocr_end - start,
+            "tokenize": tokenize_end - ocr_end,
+            "image": time.perf_counter() - tokenize_end,
+        },
+    }
 
-        for word in element[1].split():
-            word = word.lower()
-            text += word + " "       
-    return text
 
-def process_data_bert(model, init_directory, classes, move=False, show_info = False, include_image = True):
+def predict_proba_batch(model, batch, include_image=True):
     
     """
-    Process all images in a directory
+    Run a single forward pass over a batch of prepared samples
     
-    :param vocab: vocabulary of the text
+    :param model: model or InferenceEngine used to classify
+    :param batch: list of samples created by prepare_sample_bert
+    :param include_image: if true, the image tensor is passed to the model
     
-    :return: list of tensors of the images with text
+    :return: tensor with the probabilities of each class for each sample
     
     """
     
-    results = []
-    bert_tokenizer = BertTokenizer.from_pretrained('bert-base-uncased')
-    reader = easyocr.Reader(['en'])
-    iter_image = get_files_from_directory(init_directory)
+    if isinstance(model, InferenceEngine):
+        return model.predict_proba(batch)
+    
+    text_tensor = pad_sequence([sample["input_ids"] for sample in batch],
+                               batch_first=True,
+                               padding_value=0)
+    mask = pad_sequence([sample["mask"] for sample in batch],
+                        batch_first=True,
+                        padding_value=0)
+    
+    if include_image:
+        image_loaded = torch.cat([sample["image"] for sample in batch])
+        predict = model.forward(image_loaded, text_tensor, mask)
+
+    else:
+        predict = model.forward(text_tensor, mask)
+
+    return torch.softmax(predict, dim=1)
+
 
-    for image in iter_image:
-        text_image = image_to_text_bert(str(image), reader)
-        encoded = bert_tokenizer.encode_plus(
-            text=text_image,
-            add_special_tokens=True,
-            max_length = 512,
-            padding='max_length',           
-            return_attention_mask = True,
-            return_tensors='pt',
-            truncation=True
-        )
-        mask = encoded['attention_mask'].flatten().unsqueeze(0)
-        text_tensor = encoded['input_ids'].flatten().unsqueeze(0)
+def predict_batch(model, batch, include_image=True):
+    
+    """
+    Predict the class of a batch of prepared samples
+    
+    :param model: model used to classify
+    :param batch: list of samples created by prepare_sample_bert
+    :param include_image: if true, the image tensor is passed to the model
+    
+    :return: list with the predicted class of each sample
+    
+    """
+    
+    val, ind = predict_proba_batch(model, batch, include_image).max(1)
+    return ind.tolist()
 
-        image_loaded = load_image(str(image))
 
-        if include_image:
-            predict = model.forward(image_loaded, text_tensor, mask)
+def predict_samples(model, batch, include_image=True, key="probabilities", stage="model"):
+    
+    """
+    Predict the class of a batch and keep the probabilities in each sample
+    
+    :param model: model used to classify
+    :param batch: list of samples created by prepare_sample_bert
+    :param include_image: if true, the image tensor is passed to the model
+    :param key: key of the sample where its probabilities are saved
+    :param stage: key of the timings of the sample where the seconds of the model are saved
+    
+    :return: list with the predicted class of each sample
+    
+    """
+    
+    start = time.perf_counter()
+    probabilities = predict_proba_batch(model, batch, include_image)
+    seconds = (time.perf_counter() - start) / len(batch)
+    
+    for sample, proba in zip(batch, probabilities.tolist()):
+        sample[key] = proba
+        sample.setdefault("timings", {})[stage] = seconds
+    val, ind = probabilities.max(1)
+    return ind.tolist()
 
-        else:
-            predict = model.forward(text_tensor, mask)
 
-        val, ind = predict.squeeze(1).max(1)
-        results.append((str(image), ind.item()))
+def classify_batch(model, batch, classes, relocator=None, show_info=False, include_image=True, journal=None,
+                   results=None, metrics=None):
+    
+    """
+    Classify a batch of samples and fan the results out to each image
+    
+    :param model: model used to classify
+    :param batch: list of samples created by prepare_sample_bert
+    :param classes: tuple with the name of the classes
+    :param relocator: ImageRelocator that moves the images to the folder of their class, None does not move them
+    :param show_info: if true, print the class of each image
+    :param include_image: if true, the image tensor is passed to the model
+    :param journal: JobJournal where the prediction of each image is recorded
+    :param results: ResultStore where the probabilities, text and timings of each image are saved
+    :param metrics: PipelineMetrics where the timings of each image are added
+    
+    :return: list of tuples (path, class)
+    
+    """
+    
+    classified = []
+    predictions = predict_samples(model, batch, include_image=include_image)
+    
+    for sample, ind in zip(batch, predictions):
+        classified.append((sample["path"], ind))
+        if results is not None:
+            results.add_sample(sample)
+        if metrics is not None:
+            metrics.observe_sample(sample)
         
         if show_info:
-            print(f"La imagen {str(image)} fue clasificada como: {classes[ind.item()]}")
+            print(f"La imagen {sample['path']} fue clasificada como: {classes[ind]}")
+
+        finish_image(sample["path"], ind, relocator, journal)
+            
+    return classified
+
+
+def finish_image(path, ind, relocator=None, journal=None, topic=None):
+    
+    """
+    Record the prediction of an image in the journal and queue its move
+    
+    :param path: path of the image
+    :param ind: predicted class
+    :param relocator: ImageRelocator that moves the image to the folder of its class, None does not move it
+    :param journal: JobJournal, the prediction is recorded before the move
+                    so an interrupted move is finished in the next run
+    :param topic: predicted topic, None if there is no topic
+    
+    """
+    
+    if journal is not None:
+        journal.record(path, ind, topic, relocator is not None)
+    if relocator is not None:
+        relocator.move(path, ind, journal.mark_moved if journal is not None else None)
+
+
+def get_relocator(move, classes, relocator=None):
+    
+    """
+    Get the relocator of a classification
+    
+    :param move: if true, the images are moved to the folder of their class
+    :param classes: tuple with the name of the classes
+    :param relocator: ImageRelocator, by default one with a folder per class in the current directory
+    
+    :return: ImageRelocator or None if the images are not moved
+    
+    """
+    
+    if not move:
+        return None
+    return relocator if relocator is not None else ImageRelocator(classes)
+
 
-        if move:
-            move_image(str(image), ind.item())
+@contextmanager
+def run_relocator(move, classes, relocator=None, journal=None):
+    
+    """
+    Prepare the moves of a classification job, the moves left pending by an
+    interrupted job are done first and the buffered moves are done at the end,
+    also when the job fails or its iterator is closed
+    
+    :param move: if true, the images are moved to the folder of their class
+    :param classes: tuple with the name of the classes
+    :param relocator: ImageRelocator, by default one with a folder per class in the current directory
+    :param journal: JobJournal with the moves left pending
+    
+    :return: ImageRelocator or None if the images are not moved
+    
+    """
+    
+    relocator = get_relocator(move, classes, relocator)
+    if journal is not None and relocator is not None:
+        journal.resume_moves(relocator.move)
+    try:
+        yield relocator
+    finally:
+        if relocator is not None:
+            relocator.flush()
+
+
+def get_error_handler(journal):
+    
+    """
+    Create the function called for the images that fail
+    
+    :param journal: JobJournal where the failures are recorded, None raises the errors
+    
+    :return: function (path, error) or None
+    
+    """
+    
+    if journal is None:
+        return None
+    
+    def on_error(path, error):
+        print(f"No se pudo procesar la imagen {path}: {error}")
+        journal.record_failure(path, error)
         
-    return results
+    return on_error
 
 
+def bucket_by_length(samples, batch_size):
+    
+    """
+    Sort samples by number of tokens and split them in batches,
+    so every batch is padded to a similar length
+    
+    :param samples: list of samples created by prepare_sample_bert
+    :param batch_size: number of samples per batch
     
-import shutil    
+    :return: list of batches
+    
+    """
+    
+    samples = sorted(samples, key=lambda sample: len(sample["input_ids"]))
+    return [samples[i:i + batch_size] for i in range(0, len(samples), batch_size)]
+
 
-def check_directory(directory):
+class SampleOptions():
+    
+    """
+    Options of the preparation of the samples (ocr, tokenization and image)
+    
+    The options go as one object through the iterators of samples, so a new
+    option only needs a new attribute here. They are sent to the ocr workers,
+    where the ocr cache is opened again and the text gate counts the images
+    of the worker.
+    
+    """
+    
+    def __init__(self, bert_tokenizer=None, max_length=512, ocr_cache=None, text_gate=None, ocr_preprocess=None,
+                 ocr_text_filter=None, ocr_engine=None):
+        
+        """
+        bert_tokenizer -> tokenizer of bert, by default bert-base-uncased
+        max_length -> max number of tokens of the text of each image
+        ocr_cache -> OCRCache to reuse the text of images already processed
+        text_gate -> TextGate that skips the ocr of images without text
+        ocr_preprocess -> OCRPreprocess that downscales the image before the ocr
+        ocr_text_filter -> OCRTextFilter that drops the noisy boxes of the ocr
+        ocr_engine -> engine used for the ocr, by default easyocr in english
+        """
+        
+        if bert_tokenizer is None:
+            from transformers import BertTokenizer
+            bert_tokenizer = BertTokenizer.from_pretrained('bert-base-uncased')
+        
+        self.bert_tokenizer = bert_tokenizer
+        self.max_length = max_length
+        self.ocr_cache = ocr_cache
+        self.text_gate = text_gate
+        self.ocr_preprocess = ocr_preprocess
+        self.ocr_text_filter = ocr_text_filter
+        self.ocr_engine = ocr_engine
+    
+    def get_reader(self):
         
         """
-        Check if a directory exists
+        Return the ocr engine, the default one is created in each call
+        """
         
-        :param directory: path of the directory
+        return self.ocr_engine if self.ocr_engine is not None else create_engine()
+    
+    def prepare(self, image_path, reader):
         
-        :return: True if the directory exists, False otherwise
+        """
+        Prepare the sample of an image with prepare_sample_bert
+        
+        :param image_path: path of the image or ImageSource
+        :param reader: ocr engine returned by get_reader
+        
+        :return: sample
         
         """
         
-        if not os.path.exists(directory):
-            os.makedirs(directory)
+        return prepare_sample_bert(image_path, reader, self.bert_tokenizer, max_length=self.max_length,
+                                   cache=self.ocr_cache, text_gate=self.text_gate,
+                                   ocr_preprocess=self.ocr_preprocess, ocr_text_filter=self.ocr_text_filter)
+    
+    def __getstate__(self):
+        
+        # the connection of the cache and the lock of the gate can not be pickled
+        state = self.__dict__.copy()
+        if self.ocr_cache is not None:
+            state["ocr_cache"] = (self.ocr_cache.path, self.ocr_cache.max_entries)
+        if self.text_gate is not None:
+            state["text_gate"] = self.text_gate.canvas_size
+        return state
+    
+    def __setstate__(self, state):
+        
+        self.__dict__.update(state)
+        if self.ocr_cache is not None:
+            path, max_entries = self.ocr_cache
+            self.ocr_cache = OCRCache(path, max_entries=max_entries)
+        if self.text_gate is not None:
+            self.text_gate = TextGate(self.text_gate)
+
+
+def iter_samples(paths, options, on_error=None):
+    
+    """
+    Prepare the samples of the images one after another in this process
+    
+    :param paths: iterator of paths or ImageSource of the images, an ImageSource
+                  already decoded is not decoded again, None items are yielded
+                  as they are (marks of the image gate)
+    :param options: SampleOptions of the samples
+    :param on_error: function (path, error) called for the images that fail, None raises the error
+    
+    :return: iterator of samples
+    
+    """
+    
+    reader = options.get_reader()
+    for image in paths:
+        if image is None:
+            yield None
+            continue
+        try:
+            sample = options.prepare(image, reader)
+        except Exception as error:
+            if on_error is None:
+                raise
+            on_error(str(image), describe_error(error))
+            continue
+        yield sample
+
+
+_worker = {}
+
+
+def _init_worker(options):
+    
+    """
+    Create the reader, tokenizer and cache of an ocr worker process
+    
+    """
+    
+    torch.set_num_threads(1)
+    _worker["options"] = options
+    _worker["reader"] = options.get_reader()
+
+
+def _prepare_in_worker(image_path):
+    
+    """
+    Prepare a sample inside an ocr worker process
+    
+    :return: tuple (sample, cache hits, cache misses, images checked by the text gate,
+             images without text, error), sample is None and error describes
+             the exception if the image fails
+    
+    """
+    
+    options = _worker["options"]
+    cache = options.ocr_cache
+    text_gate = options.text_gate
+    hits, misses = (cache.hits, cache.misses) if cache is not None else (0, 0)
+    checked, skipped = (text_gate.checked, text_gate.skipped) if text_gate is not None else (0, 0)
+    sample, error = None, None
+    try:
+        sample = options.prepare(image_path, _worker["reader"])
+    except Exception as exception:
+        error = describe_error(exception)
+    if cache is not None:
+        hits, misses = cache.hits - hits, cache.misses - misses
+    if text_gate is not None:
+        checked, skipped = text_gate.checked - checked, text_gate.skipped - skipped
+    return sample, hits, misses, checked, skipped, error
+
+
+def iter_samples_parallel(paths, options, workers, queue_depth, on_error=None):
+    
+    """
+    Prepare the samples of the images in a pool of worker processes
+    Each worker has its own reader, at most queue_depth images are in
+    flight, so the ocr of the next images overlaps with the model
+    while the consumer applies backpressure
+    
+    :param paths: iterator of paths or ImageSource of the images, only the path
+                  is sent to the workers (sending the decoded image to another
+                  process costs more than decoding it again), None items are
+                  yielded in their position (marks of the image gate)
+    :param options: SampleOptions of the samples, the counters of the ocr cache
+                    and the text gate of the workers are added to its own
+    :param workers: number of worker processes
+    :param queue_depth: max number of images waiting to be consumed
+    :param on_error: function (path, error) called for the images that fail, None raises the error
+    
+    :return: iterator of samples, in the same order as paths
+    
+    """
+    
+    ocr_cache = options.ocr_cache
+    text_gate = options.text_gate
+    context = multiprocessing.get_context("spawn")
+    
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                             initargs=(options,)) as executor:
+        def submit(image):
+            if image is None:
+                return None, None
+            return str(image), executor.submit(_prepare_in_worker, str(image))
+        
+        # None is a mark of the image gate, not the end of paths
+        end = object()
+        pending = deque()
+        paths = iter(paths)
+        
+        for image in paths:
+            pending.append(submit(image))
+            
+            if len(pending) >= queue_depth:
+                break
+            
+        while pending:
+            path, future = pending.popleft()
+            sample, hits, misses, checked, skipped, error = (future.result() if future is not None
+                                                             else (None, 0, 0, 0, 0, None))
+            
+            image = next(paths, end)
+            if image is not end:
+                pending.append(submit(image))
+                
+            if ocr_cache is not None:
+                ocr_cache.hits += hits
+                ocr_cache.misses += misses
+            if text_gate is not None:
+                text_gate.count(checked, skipped)
+            if error is not None:
+                if on_error is None:
+                    raise RuntimeError(f"{path}: {error}")
+                on_error(path, error)
+                continue
+            yield sample
 
+
+def iter_batches(samples, batch_size, bucket_size):
+    
+    """
+    Group samples in batches, bucket_size batches at a time are sorted by token length
+    
+    :param samples: iterator of samples created by prepare_sample_bert, None
+                    items are yielded as they are (marks of the image gate)
+    :param batch_size: number of samples per batch
+    :param bucket_size: number of batches that are sorted together by token length
     
-def move_image(path, classify):
+    :return: iterator of batches
+    
+    """
+    
+    pool = []
+    for sample in samples:
+        if sample is None:
+            yield None
+            continue
+        pool.append(sample)
         
-    meme_path = "./meme-class"
-    check_directory(meme_path)
+        if len(pool) == batch_size * bucket_size:
+            yield from bucket_by_length(pool, batch_size)
+            pool = []
+            
+    yield from bucket_by_length(pool, batch_size)
 
-    no_meme_path = "./no-meme-class"
-    check_directory(no_meme_path)
 
-    sticker_path = "./sticker-class"
-    check_directory(sticker_path)
+def iter_directory_samples(init_directory, options=None, workers=0, queue_depth=16, scanner=None, on_error=None,
+                           journal=None):
+    
+    """
+    Prepare the samples of every image of a directory
+    
+    :param init_directory: directory with the images
+    :param options: SampleOptions of the samples, by default the ones of SampleOptions()
+    :param workers: number of processes for the ocr, 0 runs it in this process
+    :param queue_depth: max number of images prepared ahead of the model
+    :param scanner: ImageScanner used to find the images of the directory
+    :param on_error: function (path, error) called for the images that fail, None raises the error
+    :param journal: JobJournal, the images already recorded are skipped
+    
+    :return: iterator of samples
+    
+    """
+    
+    iter_image = get_files_from_directory(init_directory, scanner)
+    if journal is not None:
+        iter_image = journal.pending(iter_image)
+    return iter_path_samples(iter_image, options, workers, queue_depth, on_error)
 
+
+def iter_path_samples(paths, options=None, workers=0, queue_depth=16, on_error=None):
+    
+    """
+    Prepare the samples of the images in this process or in a pool of workers
+    
+    :param paths: iterator of paths or ImageSource of the images
+    
+    The rest of the parameters are the same as iter_directory_samples
     
+    :return: iterator of samples
+    
+    """
     
-    if classify == 0:
-        shutil.move(path, meme_path)
-    elif classify == 1:
-        shutil.move(path, no_meme_path)
+    if options is None:
+        options = SampleOptions()
+    
+    if workers > 0:
+        samples = iter_samples_parallel(paths, options, workers, queue_depth, on_error)
     else:
-        shutil.move(path, sticker_path)
+        samples = iter_samples(paths, options, on_error)
+    
+    if options.ocr_text_filter is not None:
+        return count_ocr_tokens(samples, options.ocr_text_filter)
+    return samples
+
+
+def count_ocr_tokens(samples, ocr_text_filter):
+    
+    """
+    Add the tokens of each sample before and after the filter to its counters
+    
+    :param samples: iterator of samples created by prepare_sample_bert
+    :param ocr_text_filter: OCRTextFilter used to create the samples
+    
+    :return: iterator of the same samples
+    
+    """
+    
+    for sample in samples:
+        if sample is not None:
+            ocr_text_filter.count(1, *sample["ocr_tokens"])
+        yield sample
+
+
+def iter_process_data_bert(model, init_directory, classes, move=False, show_info = False, include_image = True, *,
+                           batch_size = 1, bucket_size = 8, workers = 0, queue_depth = 16, scanner = None,
+                           journal = None, results = None, relocator = None, metrics = None, profiler = None,
+                           **sample_options):
+    
+    """
+    Process all images in a directory, yielding the results of each batch
+    as soon as the batch is classified
+    
+    :param model: model or InferenceEngine used to classify
+    :param init_directory: directory with the images
+    :param classes: tuple with the name of the classes
+    :param batch_size: number of images per forward pass
+    :param bucket_size: number of batches that are sorted together by token length
+    :param workers: number of processes for the ocr, 0 runs it in this process
+    :param queue_depth: max number of images prepared ahead of the model
+    :param scanner: ImageScanner used to find the images of the directory
+    :param journal: JobJournal where the predictions and failures are recorded,
+                    the images already recorded are skipped
+    :param results: ResultStore where the probabilities, text and timings of each image are saved
+    :param relocator: ImageRelocator used when move is true, by default one
+                      with a folder per class in the current directory
+    :param metrics: PipelineMetrics where the seconds of each stage are added
+    :param profiler: StepProfiler started by the caller, each batch is a step
+    :param sample_options: options of SampleOptions (bert_tokenizer, max_length,
+                           ocr_cache, text_gate, ocr_preprocess, ...)
+    
+    :return: iterator of tuples (path, class)
+    
+    """
+    
+    options = SampleOptions(**sample_options)
+    if not isinstance(model, InferenceEngine):
+        model = InferenceEngine(model, include_image, batch_size, options.max_length)
+    
+    with run_relocator(move, classes, relocator, journal) as relocator:
+        samples = iter_directory_samples(init_directory, options, workers=workers, queue_depth=queue_depth,
+                                         scanner=scanner, on_error=get_error_handler(journal), journal=journal)
+        for batch in iter_batches(samples, batch_size, bucket_size):
+            yield from classify_batch(model, batch, classes, relocator, show_info, include_image, journal, results,
+                                      metrics)
+            if profiler is not None:
+                profiler.step()
+
+
+def iter_process_data_cascade(classifier, topics, init_directory, classes, topic_classes, move=False,
+                              show_info=False, *, batch_size=1, bucket_size=8, workers=0, queue_depth=16,
+                              meme_class=0, scanner=None, journal=None, results=None, relocator=None, metrics=None,
+                              **sample_options):
+    
+    """
+    Classify the images of a directory and the topic of the memes
+    The ocr and tokenization run once per image, the topic model only
+    receives the images classified as memes, grouped in batches
+    
+    :param classifier: ModelMixBert or InferenceEngine that classifies memes, no memes and stickers
+    :param topics: BertModelClassification or InferenceEngine that classifies the topic of a meme
+    :param init_directory: directory with the images
+    :param classes: tuple with the name of the classes of the classifier
+    :param topic_classes: tuple with the name of the topics
+    :param meme_class: index of the meme class in classes
+    
+    The rest of the parameters are the same as iter_process_data_bert
+    
+    :return: iterator of tuples (path, class, topic), topic is None if the image is not a meme
+    
+    """
+    
+    options = SampleOptions(**sample_options)
+    if not isinstance(classifier, InferenceEngine):
+        classifier = InferenceEngine(classifier, True, batch_size, options.max_length)
+    if not isinstance(topics, InferenceEngine):
+        topics = InferenceEngine(topics, False, batch_size, options.max_length)
+    
+    def finish(sample, ind, topic):
+        if show_info:
+            topic_info = f" con tópico: {topic_classes[topic]}" if topic is not None else ""
+            print(f"La imagen {sample['path']} fue clasificada como: {classes[ind]}{topic_info}")
+        if results is not None:
+            results.add_sample(sample)
+        if metrics is not None:
+            metrics.observe_sample(sample)
+        finish_image(sample["path"], ind, relocator, journal, topic)
+        return sample["path"], ind, topic
+    
+    memes = []
+    with run_relocator(move, classes, relocator, journal) as relocator:
+        samples = iter_directory_samples(init_directory, options, workers=workers, queue_depth=queue_depth,
+                                         scanner=scanner, on_error=get_error_handler(journal), journal=journal)
+        for batch in iter_batches(samples, batch_size, bucket_size):
+            for sample, ind in zip(batch, predict_samples(classifier, batch)):
+                if ind == meme_class:
+                    memes.append(sample)
+                else:
+                    yield finish(sample, ind, None)
+                    
+            while len(memes) >= batch_size:
+                batch, memes = memes[:batch_size], memes[batch_size:]
+                for sample, topic in zip(batch, predict_samples(topics, batch, False, "topic_probabilities",
+                                                                "topics")):
+                    yield finish(sample, meme_class, topic)
+                    
+        if memes:
+            for sample, topic in zip(memes, predict_samples(topics, memes, False, "topic_probabilities", "topics")):
+                yield finish(sample, meme_class, topic)
+
+
+def iter_process_data_gated(image_model, model, init_directory, classes, threshold=0.9, move=False,
+                            show_info=False, *, batch_size=1, bucket_size=8, workers=0, queue_depth=16, stats=None,
+                            scanner=None, journal=None, results=None, relocator=None, metrics=None,
+                            **sample_options):
+    
+    """
+    Classify the images of a directory with an image only model first,
+    ocr and ModelMixBert only run for the images where the max probability
+    of the image model is under threshold
+    
+    :param image_model: CNN created with build_image_classifier
+    :param model: ModelMixBert or InferenceEngine used for the rest of the images
+    :param init_directory: directory with the images
+    :param classes: tuple with the name of the classes
+    :param threshold: min probability to accept the prediction of the image model
+    :param stats: dict where the number of images of each path ("image", "bert") is counted
     
+    The rest of the parameters are the same as iter_process_data_bert
+    
+    :return: iterator of tuples (path, class)
+    
+    """
+    
+    options = SampleOptions(**sample_options)
+    if not isinstance(model, InferenceEngine):
+        model = InferenceEngine(model, True, batch_size, options.max_length)
+    if stats is None:
+        stats = {}
+    stats.setdefault("image", 0)
+    stats.setdefault("bert", 0)
+    
+    def finish_confident():
+        while confident:
+            path, ind, probabilities, seconds = confident.popleft()
+            if show_info:
+                print(f"La imagen {path} fue clasificada como: {classes[ind]}")
+            if results is not None:
+                results.add(path, probabilities, timings={"image_model": seconds}, stage="image")
+            if metrics is not None:
+                metrics.observe("image_model", seconds)
+                metrics.count()
+            finish_image(path, ind, relocator, journal)
+            yield path, ind
+    
+    confident = deque()
+    on_error = get_error_handler(journal)
+    with run_relocator(move, classes, relocator, journal) as relocator:
+        paths = get_files_from_directory(init_directory, scanner)
+        if journal is not None:
+            paths = journal.pending(paths)
+        paths = iter_image_gate(paths, image_model, threshold, batch_size, confident, stats, on_error)
+        samples = iter_path_samples(paths, options, workers=workers, queue_depth=queue_depth, on_error=on_error)
+        
+        for batch in iter_batches(samples, batch_size, bucket_size):
+            yield from finish_confident()
+            if batch is None:
+                # a chunk of the gate had confident images, they are finished without
+                # waiting for a full bucket of the images that go through the ocr
+                continue
+            yield from classify_batch(model, batch, classes, relocator, show_info, True, journal, results, metrics)
+            
+        yield from finish_confident()
+
+
+def process_data_bert(model, init_directory, classes, move=False, show_info = False, include_image = True, **options):
+    
+    """
+    Process all images in a directory
+    
+    :param model: model used to classify
+    :param init_directory: directory with the images
+    :param classes: tuple with the name of the classes
+    :param options: options of iter_process_data_bert (batch_size, max_length, ...)
+    
+    :return: list of tuples (path, class)
+    
+    """
     
+    return list(iter_process_data_bert(model, init_directory, classes, move, show_info, include_image, **options))
 
-def set_image_dpi(file_path):
-    im = Image.open(file_path)
-    length_x, width_y = im.size
-    factor = min(1, float(1024.0 / length_x))
-    size = int(factor * length_x), int(factor * width_y)
-    im_resized = im.resize(size, Image.ANTIALIAS)
-    temp_file = tempfile.NamedTemporaryFile(delete=False,   suffix='.png')
-    temp_filename = temp_file.name
-    im_resized.save(temp_filename, dpi=(300, 300))
-    return temp_filename
\ No newline at end of file
@@ -1,15 +1,13 @@
-import nlpaug.augmenter.word as naw
-from torchvision import transforms
 from PIL import Image
-from deep_translator import GoogleTranslator
-
-
 
 
 class DataAugmentator:
 
     def __init__(self):
 
+        import nlpaug.augmenter.word as naw
+        from torchvision import transforms
+
         self.synonym_augmentator = naw.SynonymAug(aug_src='wordnet', lang='spa')
         self.random_augmentator = naw.RandomWordAug(action='delete', name='RandomWord_Aug', aug_min=1, aug_max=10, aug_p=0.3, stopwords=None,
                                                     target_words=None, tokenizer=None, reverse_tokenizer=None, stopwords_regex=None, verbose=0)
@@ -43,6 +41,8 @@ class DataAugmentator:
         """
         Back translation text
         """
+        from deep_translator import GoogleTranslator
+
         translator_en = GoogleTranslator(source='es', target='en')
         translator_es = GoogleTranslator(source='en', target='es')
         text_en = translator_en.translate(text)
@@ -3,7 +3,6 @@ from torch.utils.data import Dataset
 from torch.nn.utils.rnn import pad_sequence
 from PIL import Image
 from src.utils.utils import make_weights_for_balanced_classes
-from transformers import BertTokenizer
 
 import os
 import torch
@@ -11,8 +10,6 @@ import random
 
 
 from src.tokenizers.tokenizer import TokenizerMeme
-from deep_translator import GoogleTranslator
-from googletrans import Translator
 
 
 torch.manual_seed(42)
@@ -30,6 +27,9 @@ class ImageTextData(Dataset):
                  data_aug: bool=False,
                  bert: bool=False,):
 
+        from googletrans import Translator
+        from transformers import BertTokenizer
+
         # Dict with the initial info
         self.df = df
 
@@ -169,7 +169,8 @@ class ImageTextData(Dataset):
             text=text_str,
             add_special_tokens=True,
             max_length = 16,
-            pad_to_max_length = True,            
+            padding = "max_length",
+            truncation = True,
             return_attention_mask = True,
             return_tensors='pt',
         )
@@ -221,6 +222,8 @@ class ImageTextData(Dataset):
                 tensor_text, aug_method = [], []
                 if text != "":
                     
+                    from deep_translator import GoogleTranslator
+
                     text = self.tokenizer.clean_text(text)                                            
                     text_translate = GoogleTranslator(source='auto', target='es').translate(text)
                     if text_translate == text:
@@ -3,7 +3,6 @@ sys.path.append("../")
 import os
 print (os.getcwd())
 
-from cgi import test
 from torch.utils.data import Dataset
 from PIL import Image
 from torchvision import transforms
@@ -11,7 +10,6 @@ from src.utils.utils import weights_balanced, make_weights_for_balanced_classes
 from src.tokenizers.tokenizer_category import TokernizerMemeCategory
 from torch.nn.utils.rnn import pad_sequence
 from src.utils.category import categories, categories_new, categories_new_rec
-from transformers import BertTokenizer, PreTrainedTokenizerFast, AutoTokenizer
 from src.data_load.data_augmentation import DataAugmentator
 
 
@@ -28,6 +26,8 @@ class DataLoaderCategory(Dataset):
         self.num_workers = num_workers
         self.data_augmentation = data_augmentation
         self.BERT = BERT
+        from transformers import AutoTokenizer
+
         self.bert_tokenizer = AutoTokenizer.from_pretrained("bert-base-uncased", do_lower_case=True)
 
         self.transforms = transforms.Compose([transforms.Resize((56, 56)),
@@ -134,7 +134,8 @@ class DataLoaderCategory(Dataset):
             text=text,
             add_special_tokens=True,
             max_length = 16,
-            pad_to_max_length = True,             
+            padding = "max_length",
+            truncation = True,
             return_attention_mask = True,
             return_tensors='pt',
         )
@@ -0,0 +1,184 @@
+import torch
+
+
+def set_threads(num_threads=None, num_interop_threads=None) -> None:
+
+    """
+    Set the number of threads used by torch
+
+    :param num_threads: threads used inside an operator (intra-op)
+    :param num_interop_threads: threads used to run operators in parallel,
+                                it can only be set before torch runs any parallel work
+    """
+
+    if num_threads is not None:
+        torch.set_num_threads(num_threads)
+
+    if num_interop_threads is not None:
+        try:
+            torch.set_num_interop_threads(num_interop_threads)
+        except RuntimeError as error:
+            print(f"No se pudo cambiar la cantidad de threads inter-op: {error}")
+
+
+class InferenceEngine():
+
+    """
+    Run a model only for prediction
+
+    Forward passes run under torch.inference_mode, so no graph is built and
+    activations are released right away. The image and token tensors of
+    each batch are copied into buffers allocated once and reused.
+
+    The output of bert for an empty text is computed once, the samples
+    without text reuse it and only the rest of the batch goes through bert.
+
+    """
+
+    def __init__(self, model, include_image=True, batch_size=8, max_length=512):
+
+        """
+        model -> ModelMixBert or BertModelClassification
+        include_image -> if true, the image tensor is passed to the model
+        batch_size -> initial size of the buffers, they grow if a batch is bigger
+        max_length -> initial number of tokens of the buffers
+        """
+
+        self.model = model
+        self.model.eval()
+        self.include_image = include_image
+        self.image_buffer = torch.zeros(batch_size, 3, 56, 56)
+        self.ids_buffer = torch.zeros(batch_size * max_length, dtype=torch.int64)
+        self.mask_buffer = torch.zeros(batch_size * max_length, dtype=torch.int64)
+
+        # ModelMixBert reuses the features of bert, BertModelClassification the probabilities
+        self.reuse_empty = not include_image or hasattr(model, "classify")
+        self.empty_output = None
+        self.empty_hits = 0
+
+    def eval(self):
+
+        """
+        The model is always in eval mode, kept so the engine can be used as a model
+        """
+
+        return self
+
+    def fill_buffers(self, batch) -> tuple:
+
+        """
+        Copy a batch of samples into the buffers
+
+        :param batch: list of samples created by prepare_sample_bert
+
+        :return: tuple (image, input ids, attention mask) views of the buffers
+        """
+
+        text_tensor, mask = self.fill_text(batch)
+        if not self.include_image:
+            return None, text_tensor, mask
+
+        return self.fill_image(batch), text_tensor, mask
+
+    def fill_text(self, batch) -> tuple:
+
+        """
+        Copy the token ids and attention masks of a batch into the buffers
+
+        :return: tuple (input ids, attention mask) views of the buffers
+        """
+
+        size = len(batch)
+        length = max(len(sample["input_ids"]) for sample in batch)
+
+        if self.ids_buffer.numel() < size * length:
+            self.ids_buffer = torch.zeros(size * length, dtype=torch.int64)
+            self.mask_buffer = torch.zeros(size * length, dtype=torch.int64)
+
+        text_tensor = self.ids_buffer[:size * length].view(size, length)
+        mask = self.mask_buffer[:size * length].view(size, length)
+        text_tensor.zero_()
+        mask.zero_()
+
+        for i, sample in enumerate(batch):
+            text_tensor[i, :len(sample["input_ids"])] = sample["input_ids"]
+            mask[i, :len(sample["mask"])] = sample["mask"]
+
+        return text_tensor, mask
+
+    def fill_image(self, batch):
+
+        """
+        Copy the images of a batch into the buffer
+
+        :return: view of the buffer with the images
+        """
+
+        size = len(batch)
+        if self.image_buffer.shape[0] < size:
+            self.image_buffer = torch.zeros(size, 3, 56, 56)
+
+        image = self.image_buffer[:size]
+        for i, sample in enumerate(batch):
+            image[i] = sample["image"][0]
+
+        return image
+
+    def predict_proba(self, batch):
+
+        """
+        Run a single forward pass over a batch of prepared samples
+
+        :param batch: list of samples created by prepare_sample_bert
+
+        :return: tensor with the probabilities of each class for each sample
+        """
+
+        empty = [not sample.get("has_text", True) for sample in batch]
+        if self.reuse_empty and any(empty):
+            return self.predict_proba_reusing_empty(batch, empty)
+
+        with torch.inference_mode():
+            image, text_tensor, mask = self.fill_buffers(batch)
+
+            if self.include_image:
+                predict = self.model.forward(image, text_tensor, mask)
+            else:
+                predict = self.model.forward(text_tensor, mask)
+
+            return torch.softmax(predict, dim=1)
+
+    def predict_proba_reusing_empty(self, batch, empty):
+
+        """
+        Run a batch where some samples have no text, only the samples with
+        text go through bert
+
+        :param batch: list of samples created by prepare_sample_bert
+        :param empty: list with true for the samples without text
+
+        :return: tensor with the probabilities of each class for each sample
+        """
+
+        with torch.inference_mode():
+            if self.empty_output is None:
+                sample = batch[empty.index(True)]
+                text_tensor, mask = sample["input_ids"].unsqueeze(0), sample["mask"].unsqueeze(0)
+                if self.include_image:
+                    self.empty_output = self.model.bert(text_tensor, mask)
+                else:
+                    self.empty_output = torch.softmax(self.model.forward(text_tensor, mask), dim=1)
+
+            self.empty_hits += sum(empty)
+            with_text = torch.tensor([not is_empty for is_empty in empty])
+            samples_text = [sample for sample, is_empty in zip(batch, empty) if not is_empty]
+            output = self.empty_output.expand(len(batch), -1).clone()
+
+            if self.include_image:
+                if samples_text:
+                    output[with_text] = self.model.bert(*self.fill_text(samples_text))
+                return torch.softmax(self.model.classify(self.fill_image(batch), output), dim=1)
+
+            if samples_text:
+                output[with_text] = torch.softmax(self.model.forward(*self.fill_text(samples_text)), dim=1)
+            return output
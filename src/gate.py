@@ -0,0 +1,174 @@
+import time
+import torch
+from itertools import islice
+
+from src.model import CNN
+from src.utils.journal import describe_error
+
+
+def build_image_classifier(out_size=3):
+
+    """
+    Create the image only model used as first stage of the classifier,
+    it is trained with Train.train_model (without text) on the 56x56 images
+
+    :param out_size: number of classes
+
+    :return: CNN
+    """
+
+    return CNN(out_size)
+
+
+def load_image_classifier(path: str, out_size=3):
+
+    """
+    Load the weights saved with Train.save_model in an image only model
+
+    :param path: path of the state dict
+    :param out_size: number of classes
+
+    :return: CNN in eval mode
+    """
+
+    model = build_image_classifier(out_size)
+    model.load_state_dict(torch.load(path, map_location="cpu", weights_only=True))
+    model.eval()
+    return model
+
+
+def predict_image_proba(image_model, images):
+
+    """
+    Run the image only model over a batch of images
+
+    :param image_model: CNN created with build_image_classifier
+    :param images: tensor (batch, 3, 56, 56)
+
+    :return: tensor with the probabilities of each class for each image
+    """
+
+    with torch.inference_mode():
+        return torch.softmax(image_model.forward(images), dim=1)
+
+
+def iter_image_gate(paths, image_model, threshold, batch_size, confident, stats=None, on_error=None):
+
+    """
+    Classify the images only with their pixels, the images with a max
+    probability under threshold are yielded to go through ocr and bert
+
+    :param paths: iterator of paths of the images
+    :param image_model: CNN created with build_image_classifier
+    :param threshold: min probability to accept the prediction of the image model
+    :param batch_size: number of images per forward pass of the image model
+    :param confident: list or deque where the tuples (path, class, probabilities,
+                      seconds of the image model per image) of the accepted images
+                      are appended
+    :param stats: dict with the keys "image" and "bert" where the number of
+                  images of each path is counted
+    :param on_error: function (path, error) called for the images that can not
+                     be loaded, None raises the error
+
+    :return: iterator of ImageSource of the images that need ocr and bert, the
+             image decoded for the image model is reused by the ocr. After each
+             chunk with accepted images None is yielded, so the consumer can
+             finish them without waiting for the images of the ocr
+    """
+
+    from src.classifier import get_image_source
+
+    paths = iter(paths)
+    while True:
+        chunk = list(islice(paths, batch_size))
+        if not chunk:
+            return
+
+        batch = []
+        for path in chunk:
+            try:
+                source = get_image_source(path)
+                batch.append((source, source.tensor()))
+            except Exception as error:
+                if on_error is None:
+                    raise
+                on_error(str(path), describe_error(error))
+        if not batch:
+            continue
+
+        start = time.perf_counter()
+        probabilities = predict_image_proba(image_model, torch.cat([image for _, image in batch]))
+        seconds = (time.perf_counter() - start) / len(batch)
+        values, indices = probabilities.max(1)
+
+        accepted = False
+        for (source, image), value, ind, proba in zip(batch, values.tolist(), indices.tolist(),
+                                                      probabilities.tolist()):
+            if value >= threshold:
+                confident.append((source.path, ind, proba, seconds))
+                accepted = True
+                if stats is not None:
+                    stats["image"] += 1
+            else:
+                if stats is not None:
+                    stats["bert"] += 1
+                yield source
+
+        if accepted:
+            yield None
+
+
+def evaluate_gate(image_model, model, loader, thresholds) -> list:
+
+    """
+    Measure the fraction of images and the accuracy of each path of the
+    gate over a held-out set, for several thresholds
+
+    Both models run once over every image, so the thresholds are only
+    applied to the saved probabilities.
+
+    :param image_model: CNN created with build_image_classifier
+    :param model: ModelMixBert used for the images under the threshold
+    :param loader: DataLoader that returns (image, text, text_bert, mask_bert, label)
+    :param thresholds: list of thresholds
+
+    :return: list with a dict of results for each threshold
+    """
+
+    model.eval()
+    image_model.eval()
+    confidence = []
+    image_correct = []
+    bert_correct = []
+
+    with torch.inference_mode():
+        for image, text, text_bert, mask_bert, labels in loader:
+            values, indices = torch.softmax(image_model.forward(image), dim=1).max(1)
+            predict = model.forward(image, text_bert, mask_bert).argmax(1)
+            confidence.append(values)
+            image_correct.append(indices == labels)
+            bert_correct.append(predict == labels)
+
+    confidence = torch.cat(confidence)
+    image_correct = torch.cat(image_correct)
+    bert_correct = torch.cat(bert_correct)
+    total = len(confidence)
+
+    results = []
+    for threshold in thresholds:
+        gated = confidence >= threshold
+        image_total = int(gated.sum())
+        bert_total = total - image_total
+        correct = int(image_correct[gated].sum()) + int(bert_correct[~gated].sum())
+
+        results.append({
+            "threshold": threshold,
+            "images": total,
+            "fraction_image": image_total / total if total else 0.0,
+            "fraction_bert": bert_total / total if total else 0.0,
+            "accuracy_image": int(image_correct[gated].sum()) / image_total if image_total else None,
+            "accuracy_bert": int(bert_correct[~gated].sum()) / bert_total if bert_total else None,
+            "accuracy": correct / total if total else 0.0,
+        })
+
+    return results
@@ -1,10 +1,9 @@
-from tkinter.tix import TEXT
 import torch.nn as nn
 import torch.nn.functional as F
 import torch
     
-from torchvision import models
-from stop_words import get_stop_words
+# torchvision and stop_words are only needed by get_restnet152 and
+# make_bow_vector, they are imported there to keep this module light
     
 
 class CNN(nn.Module): 
@@ -79,6 +78,8 @@ class ImageClassificator(nn.Module):
     
 def get_restnet152(gradient=True):
     
+    from torchvision import models
+    
     model = models.resnet152(pretrained=True)
     for param in model.parameters():
         param.requires_grad = gradient
@@ -104,6 +105,8 @@ class BoWClassifier(nn.Module):
     
 def make_bow_vector(batch, vocab):
     
+    from stop_words import get_stop_words
+    
     stop_words = get_stop_words('es')
     ret = []
     for sentence in batch:
@@ -328,6 +331,10 @@ class ModelMixBert(nn.Module):
     def forward(self, image, text, attention):
         
         text_process = self.bert(text, attention)
+        return self.classify(image, text_process)
+    
+    def classify(self, image, text_process):
+        
         image_process = self.model_image(image)
         out = torch.cat([text_process, image_process], 1)
         out = self.out(out)
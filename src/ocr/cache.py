@@ -0,0 +1,147 @@
+import hashlib
+import json
+import time
+
+from src.utils.sqlite import connect_shared
+
+
+class OCRCache():
+
+    """
+    Persistent cache for the results of the OCR
+
+    Results are stored in a sqlite database and indexed by a hash of the
+    image bytes and the configuration of the reader, so identical images
+    skip the OCR across runs and processes.
+
+    """
+
+    def __init__(self, path: str, max_entries: int = 100000, evict_every: int = 100):
+
+        """
+        path -> path of the sqlite database
+        max_entries -> max number of results saved, the least recently used are evicted
+        evict_every -> number of insertions between evictions
+        """
+
+        self.path = path
+        self.max_entries = max_entries
+        self.evict_every = evict_every
+        self.hits = 0
+        self.misses = 0
+        self.inserts = 0
+
+        self.connection, self.lock = connect_shared(path)
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS ocr (
+                                       key TEXT PRIMARY KEY,
+                                       result TEXT NOT NULL,
+                                       last_access REAL NOT NULL)""")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS ocr_last_access ON ocr (last_access)")
+        self.connection.commit()
+
+    @staticmethod
+    def make_key(image_bytes: bytes, config: dict) -> str:
+
+        """
+        Create the key of an image
+
+        :param image_bytes: content of the image file
+        :param config: configuration of the reader
+
+        :return: hex digest of the image and the configuration
+        """
+
+        digest = hashlib.sha256(image_bytes)
+        digest.update(json.dumps(config, sort_keys=True).encode("utf-8"))
+        return digest.hexdigest()
+
+    def get(self, key: str) -> list:
+
+        """
+        Get the result saved for a key
+
+        :param key: key created with make_key
+
+        :return: list of (box, text, confidence) or None if the key is not saved
+        """
+
+        with self.lock:
+            row = self.connection.execute("SELECT result FROM ocr WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.connection.execute("UPDATE ocr SET last_access = ? WHERE key = ?", (time.time(), key))
+            self.connection.commit()
+        return [tuple(element) for element in json.loads(row[0])]
+
+    def put(self, key: str, result: list) -> None:
+
+        """
+        Save the result of the OCR for a key
+
+        :param key: key created with make_key
+        :param result: list returned by the reader
+        """
+
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO ocr (key, result, last_access) VALUES (?, ?, ?)",
+                                    (key, json.dumps(result, default=_to_builtin), time.time()))
+            self.connection.commit()
+            self.inserts += 1
+            inserts = self.inserts
+
+        if inserts % self.evict_every == 0:
+            self.evict()
+
+    def evict(self) -> int:
+
+        """
+        Delete the least recently used results over max_entries
+
+        :return: number of results deleted
+        """
+
+        with self.lock:
+            total = self.connection.execute("SELECT COUNT(*) FROM ocr").fetchone()[0]
+            excess = total - self.max_entries
+            if excess <= 0:
+                return 0
+
+            self.connection.execute("""DELETE FROM ocr WHERE key IN (
+                                           SELECT key FROM ocr ORDER BY last_access LIMIT ?)""", (excess,))
+            self.connection.commit()
+        return excess
+
+    def get_stats(self) -> dict:
+
+        """
+        Return the hits and misses of the cache
+        """
+
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def close(self) -> None:
+
+        """
+        Close the connection with the database
+        """
+
+        self.connection.close()
+
+
+def _to_builtin(value):
+
+    """
+    Convert numpy values returned by the reader to python values
+    """
+
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    return value
@@ -0,0 +1,197 @@
+import numpy as np
+
+# version of the input given to easyocr, part of the key of the ocr cache. The
+# version 2 passes the arrays in RGB with their grayscale, the results of the
+# first version (RGB arrays read as BGR by easyocr) are not reused
+EASYOCR_INPUT_VERSION = 2
+
+
+def reformat_input(image) -> tuple:
+
+    """
+    Image and grayscale given to the detector and the recognizer of easyocr
+
+    easyocr takes the arrays of 3 channels as BGR, the arrays of ImageSource
+    are RGB, so their grayscale is computed here. The result is the same as
+    giving easyocr the path of the file (RGB image and grayscale).
+
+    :param image: path, bytes or numpy array of the image, arrays in RGB
+
+    :return: tuple (image, grayscale image)
+    """
+
+    if isinstance(image, np.ndarray) and image.ndim == 3 and image.shape[2] == 3:
+        import cv2
+
+        return image, cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+
+    from easyocr.utils import reformat_input as easyocr_reformat_input
+
+    return easyocr_reformat_input(image)
+
+
+class EasyOCREngine():
+
+    """
+    OCR with easyocr
+
+    The reader is created the first time it is used, so the engine can be
+    sent to the ocr workers before loading the weights of the reader.
+
+    """
+
+    def __init__(self, lang_list=("en",), gpu: bool = True):
+
+        """
+        lang_list -> languages of the reader
+        gpu -> if true, easyocr uses cuda when it is available
+        """
+
+        self.lang_list = list(lang_list)
+        self.gpu = gpu
+        self._reader = None
+
+    @property
+    def reader(self):
+
+        if self._reader is None:
+            import easyocr
+
+            self._reader = easyocr.Reader(self.lang_list, gpu=self.gpu)
+        return self._reader
+
+    def load(self) -> None:
+
+        """
+        Load the weights of the reader now instead of in the first image
+        """
+
+        self.reader
+
+    def readtext(self, image) -> list:
+
+        """
+        Recognize the text of an image
+
+        :param image: path or numpy array of the image, arrays in RGB
+
+        :return: list of (box, text, confidence)
+        """
+
+        # same steps as easyocr.Reader.readtext, with the grayscale of reformat_input
+        image, grayscale = reformat_input(image)
+        horizontal_list, free_list = self.reader.detect(image, reformat=False)
+        return self.reader.recognize(grayscale, horizontal_list[0], free_list[0], reformat=False)
+
+    def detect(self, image, **options):
+        return self.reader.detect(image, **options)
+
+    def recognize(self, image, horizontal_list, free_list, **options):
+        return self.reader.recognize(image, horizontal_list, free_list, **options)
+
+    def get_config(self) -> dict:
+
+        """
+        Return the configuration, used as part of the key of the ocr cache
+        """
+
+        return {"reader": "Reader", "lang_list": self.lang_list, "input": EASYOCR_INPUT_VERSION}
+
+    def __getstate__(self):
+
+        state = self.__dict__.copy()
+        state["_reader"] = None
+        return state
+
+
+class TesseractEngine():
+
+    """
+    OCR with tesseract, much cheaper per cpu core for clean captions
+
+    The words of tesseract are grouped in lines, so the result has the same
+    format as easyocr.
+
+    """
+
+    def __init__(self, lang: str = "eng", config: str = ""):
+
+        """
+        lang -> languages of tesseract, for example "eng" or "eng+spa"
+        config -> extra options of tesseract, for example "--psm 6"
+        """
+
+        self.lang = lang
+        self.config = config
+
+    def load(self) -> None:
+
+        """
+        Tesseract runs as a new process for each image, there is nothing to load
+        """
+
+    def readtext(self, image) -> list:
+
+        """
+        Recognize the text of an image
+
+        :param image: path or numpy array of the image
+
+        :return: list of (box, text, confidence), confidence between 0 and 1
+        """
+
+        import pytesseract
+
+        data = pytesseract.image_to_data(image, lang=self.lang, config=self.config,
+                                         output_type=pytesseract.Output.DICT)
+
+        lines = {}
+        for i, word in enumerate(data["text"]):
+            confidence = float(data["conf"][i])
+            if not word.strip() or confidence < 0:
+                continue
+            key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+            lines.setdefault(key, []).append((data["left"][i], data["top"][i], data["width"][i],
+                                              data["height"][i], word, confidence))
+
+        result = []
+        for words in lines.values():
+            left = min(word[0] for word in words)
+            top = min(word[1] for word in words)
+            right = max(word[0] + word[2] for word in words)
+            bottom = max(word[1] + word[3] for word in words)
+            box = [[left, top], [right, top], [right, bottom], [left, bottom]]
+            text = " ".join(word[4] for word in words)
+            confidence = sum(word[5] for word in words) / len(words) / 100
+            result.append((box, text, confidence))
+        return result
+
+    def get_config(self) -> dict:
+
+        """
+        Return the configuration, used as part of the key of the ocr cache
+        """
+
+        return {"reader": "tesseract", "lang": self.lang, "config": self.config}
+
+
+OCR_ENGINES = {
+    "easyocr": EasyOCREngine,
+    "tesseract": TesseractEngine,
+}
+
+
+def create_engine(name: str = "easyocr", **config):
+
+    """
+    Create an ocr engine
+
+    :param name: key of OCR_ENGINES
+    :param config: options of the engine
+
+    :return: engine with a readtext method
+    """
+
+    if name not in OCR_ENGINES:
+        raise ValueError(f"Unknown ocr engine {name}, use one of {list(OCR_ENGINES)}")
+    return OCR_ENGINES[name](**config)
@@ -0,0 +1,77 @@
+import threading
+
+
+class TextGate():
+
+    """
+    Run a cheap text detection of easyocr before the full ocr
+
+    Photos and stickers usually have no text. The gate runs the detector of
+    easyocr on the image reduced to canvas_size (much cheaper than the
+    detection in full resolution, its cost grows with the pixels) and the
+    images where no text region is found skip the full detection and the
+    recognition. The images with text run the full ocr, so their result is
+    the same as without the gate.
+
+    """
+
+    def __init__(self, canvas_size: int = 640):
+
+        """
+        canvas_size -> max size of the longest side of the image given to the cheap detection
+        """
+
+        self.canvas_size = canvas_size
+        self.checked = 0
+        self.skipped = 0
+        self.lock = threading.Lock()
+
+    def readtext(self, reader, image):
+
+        """
+        Detect if an image has text and recognize it if it has any
+
+        :param reader: ocr engine or reader of easyocr, engines without a
+                       separate detection run the full ocr
+        :param image: path, bytes or array of the image, arrays in RGB
+
+        :return: list of (box, text, confidence) like reader.readtext
+        """
+
+        if not hasattr(reader, "detect"):
+            result = reader.readtext(image)
+            self.count(1, 0 if result else 1)
+            return result
+
+        from src.ocr.engines import reformat_input
+
+        img, img_cv_grey = reformat_input(image)
+        # the detector of easyocr reduces the image to canvas_size before the network
+        horizontal_list, free_list = reader.detect(img, canvas_size=self.canvas_size, reformat=False)
+
+        found = bool(horizontal_list[0] or free_list[0])
+        self.count(1, 0 if found else 1)
+        if not found:
+            return []
+
+        # same steps as EasyOCREngine.readtext, in full resolution
+        horizontal_list, free_list = reader.detect(img, reformat=False)
+        return reader.recognize(img_cv_grey, horizontal_list[0], free_list[0], reformat=False)
+
+    def count(self, checked: int, skipped: int) -> None:
+
+        """
+        Add images to the counters, also used for the counters of the ocr workers
+        """
+
+        with self.lock:
+            self.checked += checked
+            self.skipped += skipped
+
+    def get_stats(self) -> dict:
+
+        """
+        Return the number of images checked and the number without text
+        """
+
+        return {"checked": self.checked, "skipped": self.skipped}
@@ -0,0 +1,60 @@
+import numpy as np
+from PIL import Image
+
+
+class OCRPreprocess():
+
+    """
+    Prepare in memory the image that is given to the OCR
+
+    The time of easyocr grows with the size of the image, a 4000px
+    screenshot is downscaled to max_side before the OCR. Jpeg images
+    are decoded directly in a reduced size when it is possible.
+
+    """
+
+    def __init__(self, max_side: int = None, grayscale: bool = False):
+
+        """
+        max_side -> max size of the longest side of the image, None keeps the full resolution
+        grayscale -> if true, the image is converted to grayscale
+        """
+
+        self.max_side = max_side
+        self.grayscale = grayscale
+
+    def __call__(self, source):
+
+        """
+        Create the input of the OCR
+
+        :param source: ImageSource of the image
+
+        :return: numpy array, (height, width, 3) RGB or (height, width) in grayscale
+        """
+
+        if self.max_side is None:
+            array = source.array
+        else:
+            array = source.decode((self.max_side, self.max_side))
+
+        if self.max_side is None and not self.grayscale:
+            return array
+
+        image = Image.fromarray(array)
+        if self.max_side is not None and max(image.size) > self.max_side:
+            scale = self.max_side / max(image.size)
+            size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+            image = image.resize(size, Image.BILINEAR, reducing_gap=2.0)
+
+        if self.grayscale:
+            image = image.convert("L")
+        return np.asarray(image)
+
+    def get_config(self) -> dict:
+
+        """
+        Return the configuration, used as part of the key of the ocr cache
+        """
+
+        return {"max_side": self.max_side, "grayscale": self.grayscale}
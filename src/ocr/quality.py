@@ -0,0 +1,74 @@
+import difflib
+import os
+import re
+import unicodedata
+
+
+def normalize_text(text) -> list:
+
+    """
+    Lowercase, remove accents and punctuation and split in words
+
+    :param text: text to normalize
+
+    :return: list of words
+    """
+
+    if not isinstance(text, str):
+        return []
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return re.findall(r"\w+", text)
+
+
+def text_similarity(predicted, reference) -> float:
+
+    """
+    Similarity between the words of two texts, 1 when they are equal
+
+    :param predicted: text recognized by the ocr
+    :param reference: text written by hand
+
+    :return: ratio of difflib between the lists of words
+    """
+
+    return difflib.SequenceMatcher(None, normalize_text(predicted), normalize_text(reference)).ratio()
+
+
+def word_recall(predicted, reference) -> float:
+
+    """
+    Fraction of the words of the reference that are in the recognized text
+    """
+
+    reference_words = normalize_text(reference)
+    if not reference_words:
+        return 1.0
+    predicted_words = set(normalize_text(predicted))
+    return sum(word in predicted_words for word in reference_words) / len(reference_words)
+
+
+def load_reference_texts(csv_path: str, images_dir: str = "./categoria/images", limit: int = None) -> list:
+
+    """
+    Read the images of final.csv that have a text written by hand
+
+    :param csv_path: path of final.csv
+    :param images_dir: folder of the images of the links column
+    :param limit: max number of images
+
+    :return: list of (path of the image, text_manual)
+    """
+
+    import pandas as pd
+
+    data = pd.read_csv(csv_path)
+    references = []
+    for link, text in zip(data["links"], data["text_manual"]):
+        path = os.path.join(images_dir, str(link))
+        if link == "No" or not isinstance(text, str) or not os.path.exists(path):
+            continue
+        references.append((path, text))
+        if limit is not None and len(references) >= limit:
+            break
+    return references
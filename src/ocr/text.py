@@ -0,0 +1,170 @@
+import threading
+
+
+def join_text(result) -> str:
+
+    """
+    Join the text of every box recognized by the ocr, in lowercase
+
+    :param result: list of (box, text, confidence) returned by readtext
+
+    :return: text of the image
+    """
+
+    text = ""
+    for element in result:
+        for word in element[1].split():
+            text += word.lower() + " "
+    return text
+
+
+def estimate_tokens(raw_text: str, text: str, tokens: int, max_tokens: int) -> int:
+
+    """
+    Estimate the tokens of bert of the raw text of the ocr from the tokens of the filtered text
+
+    The filtered text is already tokenized for the model, the raw text is
+    not tokenized again only for the statistics: its words are counted and
+    multiplied by the tokens per word of the filtered text.
+
+    :param raw_text: text of the ocr before the filter
+    :param text: text after the filter
+    :param tokens: number of tokens of text, without the special tokens
+    :param max_tokens: max number of tokens given to bert
+
+    :return: estimated number of tokens of raw_text, at most max_tokens
+    """
+
+    raw_words, words = len(raw_text.split()), len(text.split())
+    estimate = round(raw_words * tokens / words) if words else raw_words
+    return min(max(estimate, tokens), max_tokens)
+
+
+def sort_reading_order(result) -> list:
+
+    """
+    Sort the boxes of the ocr from top to bottom and from left to right,
+    boxes whose vertical center is within half a line height are in the same line
+
+    :param result: list of (box, text, confidence) returned by readtext
+
+    :return: list sorted in reading order
+    """
+
+    if not result:
+        return []
+
+    boxes = []
+    for element in result:
+        ys = [point[1] for point in element[0]]
+        xs = [point[0] for point in element[0]]
+        boxes.append(((min(ys) + max(ys)) / 2, max(ys) - min(ys), min(xs), element))
+
+    heights = sorted(height for _, height, _, _ in boxes)
+    tolerance = heights[len(heights) // 2] / 2
+
+    lines = []
+    for center, _, left, element in sorted(boxes, key=lambda box: box[0]):
+        if lines and center - lines[-1][0] <= tolerance:
+            lines[-1][1].append((left, element))
+        else:
+            lines.append((center, [(left, element)]))
+
+    return [element for _, line in lines for _, element in sorted(line, key=lambda box: box[0])]
+
+
+class OCRTextFilter():
+
+    """
+    Create the text given to bert from the boxes of the ocr
+
+    Boxes under min_confidence are dropped, the rest are sorted in reading
+    order, repeated fragments are removed and the text is cut at max_words.
+    Noisy fragments make the input of bert longer without helping the
+    prediction.
+
+    """
+
+    def __init__(self, min_confidence: float = 0.0, reading_order: bool = True, dedupe: bool = True,
+                 max_words: int = None):
+
+        """
+        min_confidence -> min confidence of a box to keep its text
+        reading_order -> if true, the boxes are sorted from top to bottom and left to right
+        dedupe -> if true, boxes with the same text as a previous box are dropped
+        max_words -> max number of words of the text, None keeps every word
+        """
+
+        self.min_confidence = min_confidence
+        self.reading_order = reading_order
+        self.dedupe = dedupe
+        self.max_words = max_words
+        self.images = 0
+        self.tokens_before = 0
+        self.tokens_after = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, result) -> str:
+
+        """
+        Filter the result of the ocr
+
+        :param result: list of (box, text, confidence) returned by readtext
+
+        :return: text of the image, in the same format as join_text
+        """
+
+        result = [element for element in result if element[2] >= self.min_confidence]
+        if self.reading_order:
+            result = sort_reading_order(result)
+
+        words = []
+        seen = set()
+        for element in result:
+            fragment = " ".join(element[1].lower().split())
+            if self.dedupe:
+                if fragment in seen:
+                    continue
+                seen.add(fragment)
+            words.extend(fragment.split())
+
+        if self.max_words is not None:
+            words = words[:self.max_words]
+        return "".join(word + " " for word in words)
+
+    def count(self, images: int, tokens_before: int, tokens_after: int) -> None:
+
+        """
+        Add the number of tokens of bert before (estimated with estimate_tokens) and after the filter
+        """
+
+        with self.lock:
+            self.images += images
+            self.tokens_before += tokens_before
+            self.tokens_after += tokens_after
+
+    def __getstate__(self):
+
+        # the filter is sent to the ocr workers, the lock can not be pickled
+        state = self.__dict__.copy()
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state):
+
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def get_stats(self) -> dict:
+
+        """
+        Return the mean number of tokens saved per image
+        """
+
+        saved = self.tokens_before - self.tokens_after
+        return {
+            "images": self.images,
+            "tokens_before": self.tokens_before,
+            "tokens_after": self.tokens_after,
+            "tokens_saved_per_image": saved / self.images if self.images else 0.0,
+        }
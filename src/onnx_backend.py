@@ -0,0 +1,93 @@
+import inspect
+
+import torch
+
+
+def export_onnx(model, path: str, include_image: bool = True, opset: int = 14) -> None:
+
+    """
+    Export a model to onnx with dynamic batch and sequence axes
+
+    :param model: ModelMixBert (image, input_ids, attention_mask) or
+                  BertModelClassification (input_ids, attention_mask)
+    :param path: path of the onnx file
+    :param include_image: if true, the model receives the image tensor
+    :param opset: onnx opset version
+    """
+
+    model.eval()
+    input_ids = torch.ones(2, 16, dtype=torch.int64)
+    attention_mask = torch.ones(2, 16, dtype=torch.int64)
+    sequence_axes = {0: "batch", 1: "sequence"}
+
+    if include_image:
+        inputs = (torch.zeros(2, 3, 56, 56), input_ids, attention_mask)
+        input_names = ["image", "input_ids", "attention_mask"]
+        dynamic_axes = {"image": {0: "batch"}, "input_ids": sequence_axes, "attention_mask": sequence_axes}
+    else:
+        inputs = (input_ids, attention_mask)
+        input_names = ["input_ids", "attention_mask"]
+        dynamic_axes = {"input_ids": sequence_axes, "attention_mask": sequence_axes}
+    dynamic_axes["logits"] = {0: "batch"}
+
+    options = {}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        # the dynamo exporter does not accept dynamic_axes
+        options["dynamo"] = False
+
+    with torch.no_grad():
+        torch.onnx.export(model, inputs, path,
+                          input_names=input_names,
+                          output_names=["logits"],
+                          dynamic_axes=dynamic_axes,
+                          opset_version=opset,
+                          **options)
+
+
+class OnnxModel():
+
+    """
+    Run an exported model with the cpu execution provider of onnxruntime
+
+    It has the same forward as the torch model, so it can be used by
+    InferenceEngine and the rest of the classifier.
+
+    """
+
+    def __init__(self, path: str, num_threads: int = None):
+
+        """
+        path -> path of the onnx file created with export_onnx
+        num_threads -> threads used inside each operator, by default onnxruntime decides
+        """
+
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads is not None:
+            options.intra_op_num_threads = num_threads
+
+        self.session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [node.name for node in self.session.get_inputs()]
+        self.include_image = "image" in self.input_names
+
+    def eval(self):
+        return self
+
+    def forward(self, *inputs):
+
+        """
+        Run the model
+
+        :param inputs: (image, input_ids, attention_mask) or (input_ids, attention_mask)
+
+        :return: tensor with the logits
+        """
+
+        feed = {name: tensor.numpy() for name, tensor in zip(self.input_names, inputs)}
+        logits = self.session.run(["logits"], feed)[0]
+        return torch.from_numpy(logits)
+
+    def __call__(self, *inputs):
+        return self.forward(*inputs)
@@ -0,0 +1,151 @@
+import os
+import shutil
+import time
+
+import torch
+from torch.profiler import ProfilerActivity, profile, schedule
+
+
+class StepProfiler():
+
+    """
+    Profile a window of steps (batches) with torch.profiler
+
+    The first wait steps are skipped, the next warmup steps are profiled
+    but discarded and the next active steps are recorded, with the cpu time
+    and memory of every operator. When the window ends the chrome trace is
+    saved in output_dir (open it in chrome://tracing or ui.perfetto.dev),
+    the output of the tensorboard profiler is saved in tensorboard_dir and
+    the operators that took more time are printed. Outside of the window
+    the overhead is only counting the steps.
+
+    """
+
+    def __init__(self, output_dir: str, wait: int = 1, warmup: int = 1, active: int = 3, repeat: int = 1,
+                 tensorboard_dir: str = None, writer=None, record_shapes: bool = True, with_stack: bool = False,
+                 sort_by: str = "self_cpu_time_total", row_limit: int = 20, name: str = "profile"):
+
+        """
+        output_dir -> folder where the chrome traces are saved
+        wait -> steps skipped before the window
+        warmup -> steps profiled and discarded before the recorded ones
+        active -> steps recorded
+        repeat -> number of windows, 0 repeats them until the end
+        tensorboard_dir -> folder of the output of the tensorboard profiler, by default
+                           the folder of writer, None without writer does not save it
+        writer -> SummaryWriter where the table of operators is also added as text
+        record_shapes -> if true, the shapes of the inputs of the operators are saved
+        with_stack -> if true, the python stack of the operators is saved (slower)
+        sort_by -> column used to sort the table of operators
+        row_limit -> number of operators of the table
+        name -> prefix of the files of the traces
+        """
+
+        self.output_dir = output_dir
+        self.wait = wait
+        self.warmup = warmup
+        self.active = active
+        self.repeat = repeat
+        self.tensorboard_dir = tensorboard_dir
+        self.writer = writer
+        self.record_shapes = record_shapes
+        self.with_stack = with_stack
+        self.sort_by = sort_by
+        self.row_limit = row_limit
+        self.name = name
+        self.steps = 0
+        self.traces = []
+        self.profiler = None
+
+    def get_activities(self) -> list:
+
+        activities = [ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(ProfilerActivity.CUDA)
+        return activities
+
+    def start(self) -> None:
+
+        """
+        Start counting the steps
+        """
+
+        if self.profiler is not None:
+            return
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.steps = 0
+        self.profiler = profile(
+            activities=self.get_activities(),
+            schedule=schedule(wait=self.wait, warmup=self.warmup, active=self.active, repeat=self.repeat),
+            on_trace_ready=self.on_trace_ready,
+            record_shapes=self.record_shapes,
+            profile_memory=True,
+            with_stack=self.with_stack,
+        )
+        self.profiler.start()
+
+    def step(self) -> None:
+
+        """
+        Mark the end of a step, the profiler is stopped once every window is recorded
+        """
+
+        if self.profiler is None:
+            return
+        self.profiler.step()
+        self.steps += 1
+        if self.repeat and self.steps >= (self.wait + self.warmup + self.active) * self.repeat:
+            self.stop()
+
+    def stop(self) -> None:
+
+        """
+        Stop the profiler, a window that is not complete is saved with the steps it has
+        """
+
+        if self.profiler is None:
+            return
+        profiler, self.profiler = self.profiler, None
+        profiler.stop()
+
+    def on_trace_ready(self, profiler) -> None:
+
+        """
+        Save the traces of a window and print its operators
+        """
+
+        path = os.path.join(self.output_dir, f"{self.name}_step{profiler.step_num}.json")
+        profiler.export_chrome_trace(path)
+        self.traces.append(path)
+
+        tensorboard_dir = self.tensorboard_dir
+        if tensorboard_dir is None and self.writer is not None:
+            tensorboard_dir = self.writer.log_dir
+        if tensorboard_dir is not None:
+            # a trace can be saved only once, the plugin of tensorboard reads a copy
+            # named <worker>.<time in ms>.pt.trace.json
+            os.makedirs(tensorboard_dir, exist_ok=True)
+            copy = os.path.join(tensorboard_dir, f"{self.name}.{int(time.time() * 1000)}.pt.trace.json")
+            shutil.copyfile(path, copy)
+
+        table = self.get_table(profiler)
+        print(f"\nOperadores con más tiempo ({self.name}, paso {profiler.step_num}), traza en {path}")
+        print(table)
+        if self.writer is not None:
+            # add_text renders markdown, the indentation keeps the columns aligned
+            self.writer.add_text(f"profiler/{self.name}", "    " + table.replace("\n", "\n    "), profiler.step_num)
+
+    def get_table(self, profiler) -> str:
+
+        """
+        Return the table of the operators that took more time in the window
+        """
+
+        return profiler.key_averages().table(sort_by=self.sort_by, row_limit=self.row_limit)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
@@ -0,0 +1,82 @@
+import time
+
+import torch
+import torch.nn as nn
+
+
+def quantize_model(model):
+
+    """
+    Apply dynamic int8 quantization to the Linear layers of a model
+
+    The weights of the Linear layers (bert encoder and classification
+    heads) are stored in int8 and the activations are quantized on the fly,
+    the convolutions of the image model stay in float.
+
+    :param model: ModelMixBert or BertModelClassification
+
+    :return: quantized model, only for cpu inference
+    """
+
+    model.eval()
+    return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+
+def is_quantized(model) -> bool:
+
+    """
+    Return true if the model has dynamic quantized layers
+    """
+
+    return any(isinstance(module, torch.ao.nn.quantized.dynamic.Linear) for module in model.modules())
+
+
+def check_parity(reference, candidate, loader, include_image=True) -> dict:
+
+    """
+    Compare the predictions of two models over a held-out set
+
+    :param reference: fp32 model
+    :param candidate: model to compare, for example the quantized one
+    :param loader: DataLoader that returns (image, text, text_bert, mask_bert, label)
+    :param include_image: if true, the image tensor is passed to the models
+
+    :return: dict with the accuracy of each model, the agreement between
+             them, the max difference of probabilities and the time of each model
+    """
+
+    reference.eval()
+    candidate.eval()
+    total = 0
+    agreement = 0
+    correct = {"reference": 0, "candidate": 0}
+    seconds = {"reference": 0.0, "candidate": 0.0}
+    max_difference = 0.0
+
+    with torch.inference_mode():
+        for image, text, text_bert, mask_bert, labels in loader:
+            probabilities = {}
+            for name, model in (("reference", reference), ("candidate", candidate)):
+                start = time.perf_counter()
+                if include_image:
+                    predict = model.forward(image, text_bert, mask_bert)
+                else:
+                    predict = model.forward(text_bert, mask_bert)
+                seconds[name] += time.perf_counter() - start
+                probabilities[name] = torch.softmax(predict, dim=1)
+                correct[name] += (probabilities[name].argmax(1) == labels).sum().item()
+
+            agreement += (probabilities["reference"].argmax(1) == probabilities["candidate"].argmax(1)).sum().item()
+            difference = (probabilities["reference"] - probabilities["candidate"]).abs().max().item()
+            max_difference = max(max_difference, difference)
+            total += len(labels)
+
+    return {
+        "images": total,
+        "accuracy_reference": correct["reference"] / total if total else 0.0,
+        "accuracy_candidate": correct["candidate"] / total if total else 0.0,
+        "agreement": agreement / total if total else 0.0,
+        "max_probability_difference": max_difference,
+        "seconds_reference": seconds["reference"],
+        "seconds_candidate": seconds["candidate"],
+    }
@@ -0,0 +1,331 @@
+import json
+import os
+import queue
+import threading
+import time
+
+import torch
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from src.classifier import SampleOptions, predict_proba_batch
+from src.engine import InferenceEngine
+from src.utils.image_source import ImageSource
+
+
+class MicroBatcher():
+
+    """
+    Group the samples of concurrent requests in batches
+
+    A batch is sent to the model when it reaches batch_size samples or when
+    the first sample of the batch has waited max_latency seconds.
+
+    """
+
+    def __init__(self, model, include_image=True, batch_size=8, max_latency=0.01):
+
+        """
+        model -> model or InferenceEngine used to classify
+        include_image -> if true, the image tensor is passed to the model
+        batch_size -> max number of samples per forward pass
+        max_latency -> max seconds a sample waits for the batch to fill
+        """
+
+        self.model = model
+        self.include_image = include_image
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, sample) -> list:
+
+        """
+        Classify a sample, blocking until its batch is processed
+
+        :param sample: sample created by prepare_sample_bert
+
+        :return: list with the probability of each class
+        """
+
+        slot = {"sample": sample, "event": threading.Event()}
+        self.queue.put(slot)
+        slot["event"].wait()
+
+        if "error" in slot:
+            raise slot["error"]
+        return slot["probabilities"]
+
+    def run(self) -> None:
+
+        """
+        Loop of the batching thread
+        """
+
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.max_latency
+
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                with torch.no_grad():
+                    probabilities = predict_proba_batch(self.model, [slot["sample"] for slot in batch],
+                                                        self.include_image)
+                for slot, probability in zip(batch, probabilities.tolist()):
+                    slot["probabilities"] = probability
+
+            except Exception as error:
+                for slot in batch:
+                    slot["error"] = error
+
+            for slot in batch:
+                slot["event"].set()
+
+
+class ClassifierServer():
+
+    """
+    Resident classifier, the model, tokenizer and readers are loaded once
+    and shared by every request
+
+    """
+
+    def __init__(self, model, classes, bert_tokenizer, readers, include_image=True,
+                 batch_size=8, max_latency=0.01, max_length=512, ocr_cache=None, text_gate=None,
+                 ocr_preprocess=None, ocr_text_filter=None, metrics=None, root=None, max_body_size=20 * 2**20):
+
+        """
+        model -> model used to classify
+        classes -> tuple with the name of the classes
+        bert_tokenizer -> tokenizer of bert
+        readers -> list of ocr engines, each one is used by a request at a time
+        max_length -> max number of tokens of the text of each image
+        ocr_cache -> OCRCache to reuse the text of images already processed
+        text_gate -> TextGate that skips the ocr of images without text
+        ocr_preprocess -> OCRPreprocess that downscales the image before the ocr
+        ocr_text_filter -> OCRTextFilter that drops the noisy boxes of the ocr
+        metrics -> PipelineMetrics where the seconds of each request are added
+        root -> directory of the images that can be requested by path, None rejects the requests by path
+        max_body_size -> max bytes of the body of a request
+        """
+
+        self.model = model
+        self.classes = classes
+        self.include_image = include_image
+        self.options = SampleOptions(bert_tokenizer=bert_tokenizer, max_length=max_length, ocr_cache=ocr_cache,
+                                     text_gate=text_gate, ocr_preprocess=ocr_preprocess,
+                                     ocr_text_filter=ocr_text_filter)
+        self.metrics = metrics
+        self.root = os.path.realpath(root) if root is not None else None
+        self.max_body_size = max_body_size
+        self.readers = queue.Queue()
+        for reader in readers:
+            self.readers.put(reader)
+
+        self.engine = InferenceEngine(model, include_image, batch_size, max_length)
+        self.batcher = MicroBatcher(self.engine, include_image, batch_size, max_latency)
+
+    def warmup(self) -> None:
+
+        """
+        Run a forward pass with an empty text and a black image
+        """
+
+        encoded = self.options.bert_tokenizer.encode_plus(text="", add_special_tokens=True,
+                                                  return_attention_mask=True, return_tensors='pt')
+        sample = {
+            "path": None,
+            "input_ids": encoded['input_ids'].flatten(),
+            "mask": encoded['attention_mask'].flatten(),
+            "image": torch.zeros(1, 3, 56, 56),
+        }
+        self.batcher.submit(sample)
+
+    def prepare(self, image_path):
+
+        """
+        Run the ocr and tokenization of an image (path or ImageSource) with one of the free readers
+        """
+
+        reader = self.readers.get()
+        try:
+            sample = self.options.prepare(image_path, reader)
+        finally:
+            self.readers.put(reader)
+
+        if self.options.ocr_text_filter is not None:
+            self.options.ocr_text_filter.count(1, *sample["ocr_tokens"])
+        return sample
+
+    def classify_path(self, image_path: str) -> dict:
+
+        """
+        Classify an image saved in disk
+
+        :param image_path: path of the image, it must be inside root
+
+        :return: dict with the class, label and probabilities
+        """
+
+        return self.classify_source(ImageSource(self.resolve_path(image_path)))
+
+    def resolve_path(self, image_path: str) -> str:
+
+        """
+        Return the real path of an image requested by path
+
+        The links are resolved before the check, so a link inside root can
+        not point to a file outside of it.
+
+        :param image_path: path of the image
+
+        :return: real path of the image
+        """
+
+        if self.root is None:
+            raise PermissionError("the server does not accept images by path")
+        path = os.path.realpath(image_path)
+        if os.path.commonpath([self.root, path]) != self.root:
+            raise PermissionError(f"{image_path} is outside of the root of the server")
+        return path
+
+    def classify_source(self, source: ImageSource) -> dict:
+
+        """
+        Classify an image, it is decoded once for the ocr and the model
+
+        :param source: ImageSource of the image
+
+        :return: dict with the class, label and probabilities
+        """
+
+        start = time.perf_counter()
+        sample = self.prepare(source)
+        prepared = time.perf_counter()
+        probabilities = self.batcher.submit(sample)
+        if self.metrics is not None:
+            end = time.perf_counter()
+            # batch is the wait for the batch to fill plus the forward pass
+            sample["timings"]["batch"] = end - prepared
+            sample["timings"]["request"] = end - start
+            self.metrics.observe_sample(sample)
+
+        classify = max(range(len(probabilities)), key=probabilities.__getitem__)
+        return {
+            "path": source.path,
+            "class": classify,
+            "label": self.classes[classify],
+            "probabilities": dict(zip(self.classes, probabilities)),
+        }
+
+    def classify_bytes(self, data: bytes) -> dict:
+
+        """
+        Classify an uploaded image
+
+        :param data: content of the image file
+
+        :return: dict with the class, label and probabilities
+        """
+
+        return self.classify_source(ImageSource(None, data))
+
+
+class ClassifierRequestHandler(BaseHTTPRequestHandler):
+
+    """
+    POST /classify with a json body {"path": ...} (an image inside the root of
+    the server) or with the image as body, up to max_body_size bytes
+    GET /health
+    GET /metrics, in the text format of Prometheus, if the server has metrics
+
+    """
+
+    def do_GET(self):
+
+        if self.path == "/health":
+            self.send_json(200, {"status": "ok"})
+        elif self.path == "/metrics" and self.server.app.metrics is not None:
+            data = self.server.app.metrics.to_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        else:
+            self.send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+
+        if self.path != "/classify":
+            self.send_json(404, {"error": "not found"})
+            return
+
+        app = self.server.app
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.send_json(400, {"error": "invalid Content-Length"})
+            return
+        if length > app.max_body_size:
+            # the body is not read, the connection is closed after the answer
+            self.close_connection = True
+            self.send_json(413, {"error": f"the body is larger than {app.max_body_size} bytes"})
+            return
+        body = self.rfile.read(length)
+
+        try:
+            if self.headers.get("Content-Type", "").startswith("application/json"):
+                result = app.classify_path(json.loads(body)["path"])
+            else:
+                result = app.classify_bytes(body)
+            self.send_json(200, result)
+
+        except PermissionError as error:
+            self.send_json(403, {"error": str(error)})
+        except Exception as error:
+            self.send_json(400, {"error": str(error)})
+
+    def send_json(self, status, content):
+
+        data = json.dumps(content, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(app: ClassifierServer, host: str = "127.0.0.1", port: int = 8000) -> None:
+
+    """
+    Start the http server, blocks until it is interrupted
+
+    :param app: ClassifierServer used to answer the requests
+    :param host: address to listen
+    :param port: port to listen
+    """
+
+    server = ThreadingHTTPServer((host, port), ClassifierRequestHandler)
+    server.app = app
+    print(f"Escuchando en http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
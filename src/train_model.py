@@ -13,7 +13,8 @@ torch.backends.cudnn.deterministic = True
 class Train():
     def __init__(self, model, optimizer, criterion, train_loader, test_loader,
                  epochs=100, prints_every=1, device='cuda', writer=None, show_matrix=False, show_image=False,
-                 classes = ('Meme', 'No Meme', 'Sticker'), include_text = False, show_metrics = False, only_text = False) -> None:
+                 classes = ('Meme', 'No Meme', 'Sticker'), include_text = False, show_metrics = False, only_text = False,
+                 profiler = None) -> None:
         self.model = model
         self.optimizer = optimizer
         self.criterion = criterion
@@ -40,6 +41,12 @@ class Train():
 
         self.classes = classes
 
+        # StepProfiler that records a window of training steps, its tensorboard
+        # output goes to the folder of the writer
+        self.profiler = profiler
+        if self.profiler is not None and self.profiler.writer is None:
+            self.profiler.writer = self.writer
+
     def get_model(self):
         
         """
@@ -71,6 +78,8 @@ class Train():
         self.resumen_train()
         steps = 0
         running_loss = 0
+        if self.profiler is not None:
+            self.profiler.start()
         
         for epoch in range(self.epochs):
             
@@ -97,6 +106,8 @@ class Train():
                     loss.backward()
                     self.optimizer.step()
                     running_loss += loss.item()
+                    if self.profiler is not None:
+                        self.profiler.step()
                     
                     if steps % self.prints_every == 0:
                         test_loss = 0
@@ -177,12 +188,17 @@ class Train():
                 os.remove(er[1])
                 self.train_model()
 
+        if self.profiler is not None:
+            self.profiler.stop()
+
 
     def train_bert(self, include_image = False):
 
         self.resumen_train()
         steps = 0
         running_loss = 0
+        if self.profiler is not None:
+            self.profiler.start()
         
         for epoch in range(self.epochs):
             
@@ -207,6 +223,8 @@ class Train():
                     loss.backward()
                     self.optimizer.step()
                     running_loss += loss.item()
+                    if self.profiler is not None:
+                        self.profiler.step()
                     
                     if steps % self.prints_every == 0:
                         test_loss = 0
@@ -282,6 +300,9 @@ class Train():
                 os.remove(er[1])
                 self.train_model()
 
+        if self.profiler is not None:
+            self.profiler.stop()
+
     def resumen_train(self) -> None:
         
         """
@@ -0,0 +1,132 @@
+import hashlib
+import io
+from functools import lru_cache
+
+import numpy as np
+from PIL import Image
+
+# jpeg images are decoded for the tensor in the smallest reduced size (1/2, 1/4 or 1/8)
+# that keeps both sides over this size, twice the 56x56 input of the models
+TENSOR_DRAFT = (112, 112)
+
+@lru_cache(maxsize=None)
+def get_image_transforms():
+
+    """
+    Create once the transforms of the image used by the models
+
+    :return: transforms.Compose that returns the normalized 56x56 tensor
+    """
+
+    from torchvision import transforms
+
+    return transforms.Compose([transforms.Resize((56, 56)),
+                               transforms.ToTensor(),
+                               transforms.Normalize((0.485, 0.456, 0.406), (0.229, 0.224, 0.225))])
+
+
+def image_to_tensor(image):
+
+    """
+    Transform a PIL image in the input of the models
+
+    :param image: RGB PIL image
+
+    :return: tensor (1, 3, 56, 56)
+    """
+
+    return get_image_transforms()(image).unsqueeze(0)
+
+
+class ImageSource():
+
+    """
+    Image read from disk once and decoded at most once
+
+    The bytes are used for the key of the ocr cache, the decoded array is
+    shared by the ocr and the tensor of the model. The tensor is always
+    created from the same decoding (a jpeg reduced to TENSOR_DRAFT), so it
+    does not depend on the ocr (a hit of the cache or a reduced decoding
+    for it), and the array of the ocr is reused when it has that size.
+
+    """
+
+    def __init__(self, path, data: bytes = None):
+
+        """
+        path -> path of the image, None for images received in memory
+        data -> content of the file, by default it is read from path
+        """
+
+        self.path = str(path) if path is not None else None
+        self._data = data
+        self._array = None
+
+    @property
+    def data(self) -> bytes:
+
+        """
+        Content of the file
+        """
+
+        if self._data is None:
+            with open(self.path, "rb") as image_file:
+                self._data = image_file.read()
+        return self._data
+
+    @property
+    def sha256(self) -> str:
+
+        """
+        Hash of the content of the file
+        """
+
+        return hashlib.sha256(self.data).hexdigest()
+
+    @property
+    def array(self):
+
+        """
+        Decoded image, numpy array (height, width, 3) in RGB
+        """
+
+        return self.decode()
+
+    def decode(self, draft: tuple = None):
+
+        """
+        Decode the image the first time, later calls return the same array
+
+        :param draft: min size needed, jpeg images are decoded in the smallest
+                      reduced size over it, None decodes the full resolution
+
+        :return: numpy array (height, width, 3) in RGB
+        """
+
+        if self._array is None:
+            image = Image.open(io.BytesIO(self.data))
+            if draft is not None:
+                image.draft("RGB", draft)
+            self._array = np.asarray(image.convert("RGB"))
+        return self._array
+
+    def tensor(self):
+
+        """
+        Input of the models, created from the image decoded with TENSOR_DRAFT
+
+        The decoded image is reused if it has the same size, like the images
+        that are not jpeg or a jpeg decoded by the ocr with the same reduction.
+
+        :return: tensor (1, 3, 56, 56)
+        """
+
+        image = Image.open(io.BytesIO(self.data))
+        # draft only chooses the size of the decoding, nothing is decoded yet
+        image.draft("RGB", TENSOR_DRAFT)
+        if self._array is not None and self._array.shape[1::-1] == image.size:
+            return image_to_tensor(Image.fromarray(self._array))
+        return image_to_tensor(image.convert("RGB"))
+
+    def __str__(self):
+        return str(self.path)
@@ -0,0 +1,200 @@
+import os
+import shutil
+import time
+
+from src.utils.sqlite import connect_shared
+
+
+class JobJournal():
+
+    """
+    Progress of a classification job saved in a sqlite database
+
+    Each classified image is recorded with its prediction before it is
+    moved, and marked as moved after it, so a run that stops halfway can
+    be restarted: the recorded images are skipped and the pending moves are
+    finished. Images that fail are recorded apart (and moved to the
+    quarantine folder if there is one) instead of stopping the run.
+
+    """
+
+    def __init__(self, path: str, quarantine_dir: str = None, retry_failed: bool = False):
+
+        """
+        path -> path of the sqlite database
+        quarantine_dir -> folder where the images that fail are moved, None leaves them in place
+        retry_failed -> if true, the images that failed in a previous run are processed again
+        """
+
+        self.path = path
+        self.quarantine_dir = quarantine_dir
+        self.retry_failed = retry_failed
+        self.skipped = 0
+        self.recorded = 0
+        self.failed = 0
+        self.resumed_moves = 0
+
+        self.connection, self.lock = connect_shared(path)
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS images (
+                                       path TEXT PRIMARY KEY,
+                                       class INTEGER NOT NULL,
+                                       topic INTEGER,
+                                       move INTEGER NOT NULL,
+                                       moved INTEGER NOT NULL,
+                                       time REAL NOT NULL)""")
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS failures (
+                                       path TEXT PRIMARY KEY,
+                                       error TEXT NOT NULL,
+                                       quarantine TEXT,
+                                       time REAL NOT NULL)""")
+        self.connection.commit()
+
+    @staticmethod
+    def make_key(path) -> str:
+
+        """
+        Normalize a path, the same image has the same key in every run
+        """
+
+        return os.path.abspath(str(path))
+
+    def pending(self, paths):
+
+        """
+        Skip the images already recorded
+
+        :param paths: iterator of paths of the images
+
+        :return: iterator of the paths that are not in the journal
+        """
+
+        for path in paths:
+            key = self.make_key(path)
+            with self.lock:
+                row = self.connection.execute("SELECT 1 FROM images WHERE path = ?", (key,)).fetchone()
+                if row is None and not self.retry_failed:
+                    row = self.connection.execute("SELECT 1 FROM failures WHERE path = ?", (key,)).fetchone()
+            if row is not None:
+                self.skipped += 1
+                continue
+            yield path
+
+    def record(self, path, classify: int, topic: int = None, move: bool = False) -> None:
+
+        """
+        Save the prediction of an image, before moving it
+
+        :param path: path of the image
+        :param classify: predicted class
+        :param topic: predicted topic, None if there is no topic
+        :param move: if true, the image is going to be moved to the folder of its class
+        """
+
+        with self.lock:
+            self.connection.execute("""INSERT OR REPLACE INTO images (path, class, topic, move, moved, time)
+                                       VALUES (?, ?, ?, ?, 0, ?)""",
+                                    (self.make_key(path), classify, topic, int(move), time.time()))
+            self.connection.execute("DELETE FROM failures WHERE path = ?", (self.make_key(path),))
+            self.connection.commit()
+            self.recorded += 1
+
+    def mark_moved(self, path) -> None:
+
+        """
+        Save that an image was moved to the folder of its class
+        """
+
+        with self.lock:
+            self.connection.execute("UPDATE images SET moved = 1 WHERE path = ?", (self.make_key(path),))
+            self.connection.commit()
+
+    def resume_moves(self, move_image) -> int:
+
+        """
+        Finish the moves of the images recorded in a run that stopped before moving them
+
+        :param move_image: function (path, class, on_moved) that moves an image,
+                           like ImageRelocator.move, on_moved is called once it is moved
+
+        :return: number of images moved
+        """
+
+        with self.lock:
+            rows = self.connection.execute("SELECT path, class FROM images WHERE move = 1 AND moved = 0").fetchall()
+
+        for path, classify in rows:
+            if os.path.exists(path):
+                move_image(path, classify, self.mark_moved)
+                self.resumed_moves += 1
+            else:
+                self.mark_moved(path)
+        return self.resumed_moves
+
+    def record_failure(self, path, error: str) -> None:
+
+        """
+        Save the error of an image and move it to the quarantine folder
+
+        :param path: path of the image
+        :param error: description of the error
+        """
+
+        quarantine = None
+        if self.quarantine_dir is not None and os.path.exists(str(path)):
+            os.makedirs(self.quarantine_dir, exist_ok=True)
+            quarantine = os.path.join(self.quarantine_dir, os.path.basename(str(path)))
+            name, extension = os.path.splitext(quarantine)
+            copy = 1
+            while os.path.exists(quarantine):
+                quarantine = f"{name}_{copy}{extension}"
+                copy += 1
+            shutil.move(str(path), quarantine)
+
+        with self.lock:
+            self.connection.execute("""INSERT OR REPLACE INTO failures (path, error, quarantine, time)
+                                       VALUES (?, ?, ?, ?)""",
+                                    (self.make_key(path), error, quarantine, time.time()))
+            self.connection.commit()
+            self.failed += 1
+
+    def get_failures(self) -> list:
+
+        """
+        Return the images that failed
+
+        :return: list of tuples (path, error, quarantine path or None)
+        """
+
+        with self.lock:
+            return self.connection.execute("SELECT path, error, quarantine FROM failures ORDER BY time").fetchall()
+
+    def get_stats(self) -> dict:
+
+        """
+        Return the number of images skipped, recorded and failed in this run
+        """
+
+        return {
+            "skipped": self.skipped,
+            "recorded": self.recorded,
+            "failed": self.failed,
+            "resumed_moves": self.resumed_moves,
+        }
+
+    def close(self) -> None:
+
+        """
+        Close the connection with the database
+        """
+
+        self.connection.close()
+
+
+def describe_error(error: Exception) -> str:
+
+    """
+    Short description of an exception, saved in the journal
+    """
+
+    return f"{type(error).__name__}: {error}"
@@ -0,0 +1,232 @@
+import json
+import math
+import os
+import sys
+import threading
+import time
+
+# the latencies are counted in buckets that grow 5% each, from 10 microseconds,
+# so the memory does not grow with the number of images and the percentiles
+# have an error under 5%
+BUCKET_GROWTH = 1.05
+BUCKET_START = 1e-5
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class LatencyHistogram():
+
+    """
+    Count, sum, max and percentiles of the seconds of a stage
+    """
+
+    def __init__(self):
+
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float) -> None:
+
+        """
+        Add the seconds of an image
+        """
+
+        index = 0 if seconds <= BUCKET_START else math.ceil(math.log(seconds / BUCKET_START, BUCKET_GROWTH))
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q: float) -> float:
+
+        """
+        Return the upper bound of the bucket of the quantile q, between 0 and 1
+        """
+
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return min(BUCKET_START * BUCKET_GROWTH ** index, self.max)
+        return self.max
+
+    def get_summary(self) -> dict:
+
+        summary = {
+            "count": self.count,
+            "total": self.total,
+            "mean": self.total / self.count if self.count else 0.0,
+            "max": self.max,
+        }
+        for q in QUANTILES:
+            summary[f"p{round(q * 100)}"] = self.quantile(q)
+        return summary
+
+
+class PipelineMetrics():
+
+    """
+    Seconds of each stage of the classification, images per second and peak memory
+
+    The stages are observed only when there is a PipelineMetrics, without
+    it the pipeline only checks that it is None. The summary is saved as
+    json at the end of a run, with prometheus_path the metrics are also
+    written in the text format of Prometheus every export_every seconds
+    (for the node exporter textfile collector).
+
+    """
+
+    def __init__(self, prometheus_path: str = None, export_every: float = 15.0):
+
+        """
+        prometheus_path -> file where the metrics are written in the format of Prometheus, None does not write it
+        export_every -> min seconds between two writes of prometheus_path
+        """
+
+        self.prometheus_path = prometheus_path
+        self.export_every = export_every
+        self.stages = {}
+        self.images = 0
+        self.start = time.perf_counter()
+        self.last_export = time.monotonic()
+        self.lock = threading.Lock()
+        # the server exports from several threads, only one writes the file at a time
+        self.export_lock = threading.Lock()
+
+    def observe(self, stage: str, seconds: float) -> None:
+
+        """
+        Add the seconds of an image in a stage
+        """
+
+        with self.lock:
+            if stage not in self.stages:
+                self.stages[stage] = LatencyHistogram()
+            self.stages[stage].observe(seconds)
+
+    def observe_sample(self, sample: dict) -> None:
+
+        """
+        Add the timings of a sample and count it as a classified image
+        """
+
+        for stage, seconds in sample.get("timings", {}).items():
+            self.observe(stage, seconds)
+        self.count()
+
+    def count(self, images: int = 1) -> None:
+
+        """
+        Add classified images, the prometheus file is written if export_every seconds passed
+        """
+
+        with self.lock:
+            self.images += images
+        if self.prometheus_path is not None and time.monotonic() - self.last_export >= self.export_every:
+            self.write_prometheus(self.export_every)
+
+    def get_summary(self) -> dict:
+
+        """
+        Return the images, images per second, peak memory and the latencies of each stage
+        """
+
+        seconds = time.perf_counter() - self.start
+        with self.lock:
+            stages = {stage: histogram.get_summary() for stage, histogram in self.stages.items()}
+            images = self.images
+        peak_rss = get_peak_rss()
+        return {
+            "images": images,
+            "seconds": seconds,
+            "images_per_second": images / seconds if seconds else 0.0,
+            "peak_rss_mb": peak_rss / 2 ** 20 if peak_rss is not None else None,
+            "stages": stages,
+        }
+
+    def write_json(self, path: str) -> dict:
+
+        """
+        Save the summary in a json file
+
+        :return: the summary
+        """
+
+        summary = self.get_summary()
+        with open(path, "w") as output:
+            json.dump(summary, output, indent=2)
+        return summary
+
+    def to_prometheus(self) -> str:
+
+        """
+        Return the metrics in the text format of Prometheus
+        """
+
+        summary = self.get_summary()
+        lines = [
+            "# HELP meme_classifier_images_total Images classified",
+            "# TYPE meme_classifier_images_total counter",
+            f"meme_classifier_images_total {summary['images']}",
+            "# HELP meme_classifier_images_per_second Images classified per second since the start",
+            "# TYPE meme_classifier_images_per_second gauge",
+            f"meme_classifier_images_per_second {summary['images_per_second']}",
+        ]
+        peak_rss = get_peak_rss()
+        if peak_rss is not None:
+            lines += [
+                "# HELP meme_classifier_peak_rss_bytes Peak resident memory of the process and its workers",
+                "# TYPE meme_classifier_peak_rss_bytes gauge",
+                f"meme_classifier_peak_rss_bytes {peak_rss}",
+            ]
+        lines += [
+            "# HELP meme_classifier_stage_seconds Seconds per image of each stage",
+            "# TYPE meme_classifier_stage_seconds summary",
+        ]
+        for stage, stats in summary["stages"].items():
+            for q in QUANTILES:
+                lines.append(f'meme_classifier_stage_seconds{{stage="{stage}",quantile="{q}"}} '
+                             f'{stats[f"p{round(q * 100)}"]}')
+            lines.append(f'meme_classifier_stage_seconds_sum{{stage="{stage}"}} {stats["total"]}')
+            lines.append(f'meme_classifier_stage_seconds_count{{stage="{stage}"}} {stats["count"]}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, min_interval: float = 0.0) -> None:
+
+        """
+        Write prometheus_path, it is replaced at once so it is never read half written
+
+        :param min_interval: the file is not written if it was written less than these seconds ago
+        """
+
+        with self.export_lock:
+            if time.monotonic() - self.last_export < min_interval:
+                return
+            self.last_export = time.monotonic()
+            temporary = self.prometheus_path + ".tmp"
+            with open(temporary, "w") as output:
+                output.write(self.to_prometheus())
+            os.replace(temporary, self.prometheus_path)
+
+
+def get_peak_rss() -> int:
+
+    """
+    Peak resident memory in bytes of this process or its largest worker
+
+    :return: bytes, None where the resource module does not exist (windows)
+    """
+
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # linux reports kilobytes and macos bytes
+    return peak if sys.platform == "darwin" else peak * 1024
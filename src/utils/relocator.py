@@ -0,0 +1,213 @@
+import argparse
+import errno
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def get_class_folder(label: str) -> str:
+
+    """
+    Name of the folder of a class, "No Meme" -> "no-meme-class"
+    """
+
+    return "-".join(label.lower().split()) + "-class"
+
+
+def rename(source: str, destination: str) -> None:
+
+    """
+    Move a file with os.rename, or copy it when the folders are in different file systems
+    """
+
+    try:
+        os.rename(source, destination)
+    except OSError as error:
+        if error.errno != errno.EXDEV:
+            raise
+        shutil.move(source, destination)
+
+
+class ImageRelocator():
+
+    """
+    Move the classified images to the folder of their class
+
+    The folders are created once from the classes. The moves are queued
+    and done in batches with os.rename, in a pool of threads if there are
+    workers (on network mounts most of the time of a move is waiting). A
+    file with the same name in the destination is not replaced, a suffix
+    is added instead. Every move is appended to the manifest, so it can be
+    undone with undo_moves.
+
+    """
+
+    def __init__(self, classes: tuple, root: str = ".", manifest: str = None, workers: int = 0,
+                 batch_size: int = 64, metrics=None):
+
+        """
+        classes -> tuple with the name of the classes, one folder per class
+        root -> folder where the folders of the classes are created
+        manifest -> jsonl file where the moves are appended, None does not save them
+        workers -> number of threads that move the files, 0 moves them in this thread
+        batch_size -> number of moves queued before doing them
+        metrics -> PipelineMetrics where the seconds of the moves are added
+        """
+
+        self.folders = [os.path.join(root, get_class_folder(label)) for label in classes]
+        for folder in set(self.folders):
+            os.makedirs(folder, exist_ok=True)
+
+        self.batch_size = batch_size
+        self.metrics = metrics
+        self.pending = []
+        self.reserved = set()
+        self.moved = 0
+        self.failed = 0
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=workers) if workers > 0 else None
+        self.manifest = open(manifest, "a", encoding="utf-8") if manifest is not None else None
+
+    def move(self, path, classify: int, on_moved=None) -> None:
+
+        """
+        Queue the move of an image
+
+        :param path: path of the image
+        :param classify: class of the image
+        :param on_moved: function called with the path once the image is moved
+        """
+
+        self.pending.append((str(path), classify, on_moved))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+
+        """
+        Do the queued moves
+        """
+
+        batch, self.pending = self.pending, []
+        if not batch:
+            return
+
+        start = time.perf_counter()
+        if self.executor is not None:
+            moves = list(self.executor.map(self.move_now, batch))
+        else:
+            moves = [self.move_now(item) for item in batch]
+        self.reserved.clear()
+        if self.metrics is not None:
+            seconds = (time.perf_counter() - start) / len(batch)
+            for _ in batch:
+                self.metrics.observe("move", seconds)
+
+        records = []
+        for (path, classify, on_moved), destination in zip(batch, moves):
+            if destination is None:
+                continue
+            records.append({"source": path, "destination": destination, "class": classify, "time": time.time()})
+            if on_moved is not None:
+                on_moved(path)
+
+        if self.manifest is not None and records:
+            self.manifest.writelines(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+            self.manifest.flush()
+
+    def move_now(self, item) -> str:
+
+        """
+        Move an image to the folder of its class
+
+        :param item: tuple (path, class, on_moved)
+
+        :return: new path of the image, None if it could not be moved
+        """
+
+        path, classify = item[0], item[1]
+        destination = self.reserve(path, self.folders[classify])
+        try:
+            rename(path, destination)
+        except OSError as error:
+            print(f"No se pudo mover la imagen {path}: {error}")
+            with self.lock:
+                self.failed += 1
+            return None
+
+        with self.lock:
+            self.moved += 1
+        return destination
+
+    def reserve(self, path: str, folder: str) -> str:
+
+        """
+        Choose a name that is not used in the destination folder
+
+        :return: path of the image in the folder, "name_1.jpg" if "name.jpg" exists
+        """
+
+        name, extension = os.path.splitext(os.path.basename(path))
+        with self.lock:
+            destination = os.path.join(folder, name + extension)
+            copy = 1
+            while destination in self.reserved or os.path.exists(destination):
+                destination = os.path.join(folder, f"{name}_{copy}{extension}")
+                copy += 1
+            self.reserved.add(destination)
+        return destination
+
+    def get_stats(self) -> dict:
+
+        """
+        Return the number of images moved and the number that could not be moved
+        """
+
+        return {"moved": self.moved, "failed": self.failed}
+
+    def close(self) -> None:
+
+        """
+        Do the queued moves and close the manifest
+        """
+
+        self.flush()
+        if self.executor is not None:
+            self.executor.shutdown()
+        if self.manifest is not None:
+            self.manifest.close()
+
+
+def undo_moves(manifest: str) -> int:
+
+    """
+    Move back the images of a manifest, the last move is undone first
+
+    :param manifest: jsonl file written by ImageRelocator
+
+    :return: number of images moved back
+    """
+
+    with open(manifest, encoding="utf-8") as manifest_file:
+        records = [json.loads(line) for line in manifest_file if line.strip()]
+
+    undone = 0
+    for record in reversed(records):
+        if not os.path.exists(record["destination"]) or os.path.exists(record["source"]):
+            continue
+        os.makedirs(os.path.dirname(record["source"]) or ".", exist_ok=True)
+        rename(record["destination"], record["source"])
+        undone += 1
+    return undone
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Undo the moves of a manifest of ImageRelocator")
+    parser.add_argument("manifest", help="jsonl file written with --move-manifest")
+    args = parser.parse_args()
+
+    print(f"{undo_moves(args.manifest)} imágenes devueltas a su carpeta original")
@@ -0,0 +1,249 @@
+import json
+import time
+
+from src.utils.sqlite import connect_shared
+
+
+class ResultStore():
+
+    """
+    Results of the classification saved in a sqlite database
+
+    Each image is saved with the hash of its content, the probabilities of
+    every class, the text of the ocr, the version of the model and the
+    seconds of each stage, so a run can be audited or thresholded again
+    without running the models. Rows are buffered and inserted in batches.
+
+    """
+
+    def __init__(self, path: str, classes: tuple, model_version: str = None, run_id: str = None,
+                 topic_classes: tuple = None, flush_every: int = 100):
+
+        """
+        path -> path of the sqlite database
+        classes -> tuple with the name of the classes
+        model_version -> description of the model saved with each result
+        run_id -> name of the run, by default the date and time
+        topic_classes -> tuple with the name of the topics, only for the cascade
+        flush_every -> number of results buffered before inserting them
+        """
+
+        self.path = path
+        self.classes = classes
+        self.topic_classes = topic_classes
+        self.model_version = model_version
+        self.run_id = run_id if run_id is not None else time.strftime("%Y%m%d-%H%M%S")
+        self.flush_every = flush_every
+        self.buffer = []
+
+        self.connection, self.lock = connect_shared(path)
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS results (
+                                       id INTEGER PRIMARY KEY,
+                                       run TEXT NOT NULL,
+                                       path TEXT NOT NULL,
+                                       sha256 TEXT,
+                                       class INTEGER NOT NULL,
+                                       label TEXT NOT NULL,
+                                       probability REAL NOT NULL,
+                                       probabilities TEXT NOT NULL,
+                                       topic INTEGER,
+                                       topic_label TEXT,
+                                       topic_probabilities TEXT,
+                                       text TEXT,
+                                       stage TEXT NOT NULL,
+                                       model_version TEXT,
+                                       timings TEXT,
+                                       time REAL NOT NULL)""")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS results_run ON results (run, probability)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS results_sha256 ON results (sha256)")
+        self.connection.commit()
+
+    def add(self, path, probabilities: list, sha256: str = None, text: str = None, timings: dict = None,
+            stage: str = "bert", topic_probabilities: list = None) -> None:
+
+        """
+        Add the result of an image
+
+        :param path: path of the image
+        :param probabilities: probability of each class
+        :param sha256: hash of the content of the image
+        :param text: text of the ocr given to the model
+        :param timings: dict with the seconds of each stage
+        :param stage: "bert" or "image" if only the image model was used
+        :param topic_probabilities: probability of each topic, None if the topic was not predicted
+        """
+
+        ind = max(range(len(probabilities)), key=probabilities.__getitem__)
+        topic, topic_label = None, None
+        if topic_probabilities is not None:
+            topic = max(range(len(topic_probabilities)), key=topic_probabilities.__getitem__)
+            topic_label = self.topic_classes[topic] if self.topic_classes is not None else None
+
+        self.buffer.append((
+            self.run_id,
+            str(path),
+            sha256,
+            ind,
+            self.classes[ind],
+            probabilities[ind],
+            json.dumps(probabilities),
+            topic,
+            topic_label,
+            json.dumps(topic_probabilities) if topic_probabilities is not None else None,
+            text,
+            stage,
+            self.model_version,
+            json.dumps(timings) if timings is not None else None,
+            time.time(),
+        ))
+        if len(self.buffer) >= self.flush_every:
+            self.flush()
+
+    def add_sample(self, sample: dict) -> None:
+
+        """
+        Add the result of a sample classified with predict_samples
+
+        :param sample: sample created by prepare_sample_bert with its probabilities
+        """
+
+        self.add(sample["path"], sample["probabilities"], sample.get("sha256"), sample.get("text"),
+                 sample.get("timings"), "bert", sample.get("topic_probabilities"))
+
+    def flush(self) -> None:
+
+        """
+        Insert the buffered results
+        """
+
+        with self.lock:
+            if not self.buffer:
+                return
+            self.connection.executemany("""INSERT INTO results (run, path, sha256, class, label, probability,
+                                               probabilities, topic, topic_label, topic_probabilities, text,
+                                               stage, model_version, timings, time)
+                                           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""", self.buffer)
+            self.connection.commit()
+            self.buffer = []
+
+    def query(self, where: str = "", params: tuple = ()) -> list:
+
+        """
+        Read saved results
+
+        :param where: sql condition over the columns of the results table
+        :param params: values of the ? of the condition
+
+        :return: list of dicts, probabilities and timings are decoded
+        """
+
+        self.flush()
+        sql = "SELECT * FROM results" + (f" WHERE {where}" if where else "") + " ORDER BY id"
+        with self.lock:
+            cursor = self.connection.execute(sql, params)
+            columns = [column[0] for column in cursor.description]
+            rows = cursor.fetchall()
+
+        results = []
+        for row in rows:
+            result = dict(zip(columns, row))
+            for key in ("probabilities", "topic_probabilities", "timings"):
+                if result[key] is not None:
+                    result[key] = json.loads(result[key])
+            results.append(result)
+        return results
+
+    def get_runs(self) -> list:
+
+        """
+        Return the runs saved in the database
+
+        :return: list of tuples (run, model version, number of images)
+        """
+
+        self.flush()
+        with self.lock:
+            return self.connection.execute("""SELECT run, model_version, COUNT(*) FROM results
+                                              GROUP BY run, model_version ORDER BY MIN(id)""").fetchall()
+
+    def get_run(self, run_id: str = None) -> list:
+
+        """
+        Return the results of a run, by default the current one
+        """
+
+        return self.query("run = ?", (run_id or self.run_id,))
+
+    def get_uncertain(self, threshold: float, run_id: str = None) -> list:
+
+        """
+        Return the results of a run whose max probability is under threshold
+        """
+
+        return self.query("run = ? AND probability < ?", (run_id or self.run_id, threshold))
+
+    def get_by_hash(self, sha256: str) -> list:
+
+        """
+        Return every result of an image in any run, identical files have the same hash
+        """
+
+        return self.query("sha256 = ?", (sha256,))
+
+    def count_classes(self, run_id: str = None, threshold: float = 0.0) -> dict:
+
+        """
+        Count the images of each class in a run, the results under threshold are counted as None
+
+        :return: dict label -> number of images
+        """
+
+        self.flush()
+        with self.lock:
+            rows = self.connection.execute("""SELECT CASE WHEN probability >= ? THEN label END, COUNT(*)
+                                              FROM results WHERE run = ? GROUP BY 1""",
+                                           (threshold, run_id or self.run_id)).fetchall()
+        return dict(rows)
+
+    def get_stage_timings(self, run_id: str = None) -> dict:
+
+        """
+        Return the mean seconds per image of each stage in a run
+        """
+
+        totals = {}
+        counts = {}
+        for result in self.query("run = ? AND timings IS NOT NULL", (run_id or self.run_id,)):
+            for stage, seconds in result["timings"].items():
+                totals[stage] = totals.get(stage, 0.0) + seconds
+                counts[stage] = counts.get(stage, 0) + 1
+        return {stage: totals[stage] / counts[stage] for stage in totals}
+
+    def to_dataframe(self, run_id: str = None):
+
+        """
+        Load the results of a run in a pandas DataFrame, with one column per class
+        """
+
+        import pandas as pd
+
+        results = self.get_run(run_id)
+        for result in results:
+            for label, probability in zip(self.classes, result["probabilities"]):
+                result[f"p_{label}"] = probability
+        return pd.DataFrame(results)
+
+    def close(self) -> None:
+
+        """
+        Insert the pending results and close the connection with the database
+        """
+
+        self.flush()
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
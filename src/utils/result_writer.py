@@ -0,0 +1,91 @@
+import csv
+import json
+import os
+
+
+class ResultWriter():
+
+    """
+    Append the results of the classification to a jsonl or csv file
+
+    Records are buffered and written every flush_every records, so the
+    results are durable while the classification is still running.
+
+    """
+
+    def __init__(self, path: str, flush_every: int = 100):
+
+        """
+        path -> path of the output file, the format is taken from the extension
+        flush_every -> number of records buffered before writing them to disk
+        """
+
+        self.path = path
+        self.flush_every = flush_every
+        self.format = "csv" if path.endswith(".csv") else "jsonl"
+        self.buffer = []
+        self.fieldnames = None
+        self.new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, "a", newline="", encoding="utf-8")
+
+    def write(self, record: dict) -> None:
+
+        """
+        Add a record to the file
+
+        :param record: dict with the result of an image
+        """
+
+        self.buffer.append(record)
+        if len(self.buffer) >= self.flush_every:
+            self.flush()
+
+    def flush(self) -> None:
+
+        """
+        Write the buffered records to disk
+        """
+
+        if not self.buffer:
+            return
+
+        if self.format == "jsonl":
+            self.file.writelines(json.dumps(record, ensure_ascii=False) + "\n" for record in self.buffer)
+        else:
+            self.write_csv(self.buffer)
+
+        self.buffer = []
+        self.file.flush()
+
+    def write_csv(self, records: list) -> None:
+
+        """
+        Write records as csv rows, values that are not scalars are saved as json
+        """
+
+        if self.fieldnames is None:
+            self.fieldnames = list(records[0].keys())
+
+        writer = csv.DictWriter(self.file, fieldnames=self.fieldnames, extrasaction="ignore")
+        if self.new_file:
+            writer.writeheader()
+            self.new_file = False
+
+        for record in records:
+            writer.writerow({key: json.dumps(value, ensure_ascii=False) if isinstance(value, (list, dict)) else value
+                             for key, value in record.items()})
+
+    def close(self) -> None:
+
+        """
+        Write the pending records and close the file
+        """
+
+        self.flush()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,179 @@
+import os
+from itertools import chain, islice
+
+IMAGE_EXTENSIONS = frozenset({".jpg", ".jpeg", ".png", ".gif", ".bmp", ".webp", ".tif", ".tiff"})
+
+# first bytes of the formats in IMAGE_EXTENSIONS
+IMAGE_SIGNATURES = (
+    b"\xff\xd8\xff",
+    b"\x89PNG\r\n\x1a\n",
+    b"GIF87a",
+    b"GIF89a",
+    b"BM",
+    b"II*\x00",
+    b"MM\x00*",
+)
+
+
+def has_image_signature(path) -> bool:
+
+    """
+    Check the first bytes of a file against the signatures of the image formats
+
+    :param path: path of the file
+
+    :return: True if the content of the file is an image
+    """
+
+    try:
+        with open(path, "rb") as image_file:
+            header = image_file.read(12)
+    except OSError:
+        return False
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return True
+    return header.startswith(IMAGE_SIGNATURES)
+
+
+def iter_chunks(iterator, chunk_size: int):
+
+    """
+    Group an iterator in lists of chunk_size elements, the last one can be shorter
+
+    :param iterator: iterator of elements
+    :param chunk_size: number of elements of each list
+
+    :return: iterator of lists
+    """
+
+    iterator = iter(iterator)
+    chunk = list(islice(iterator, chunk_size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, chunk_size))
+
+
+class ImageScanner():
+
+    """
+    Find the images of a directory tree with os.scandir
+
+    Hidden files and folders and files with other extensions are skipped
+    (PIL fails with them). The entries of each folder are read one at a
+    time and only the pending subfolders are kept, so the memory does not
+    grow with the number of files. With sort_by_size the images are sorted
+    inside windows of chunk_size, so images of similar size are batched
+    together without reading the whole tree first.
+
+    """
+
+    def __init__(self, recursive: bool = True, check_magic: bool = False, sort_by_size: bool = False,
+                 chunk_size: int = 1024, extensions=IMAGE_EXTENSIONS):
+
+        """
+        recursive -> if true, the subfolders are also scanned
+        check_magic -> if true, the first bytes of each file are checked, not only the extension
+        sort_by_size -> if true, the images of each chunk are sorted by the size of the file
+        chunk_size -> number of paths of each chunk returned by iter_chunks
+        extensions -> extensions in lowercase of the files that are kept
+        """
+
+        self.recursive = recursive
+        self.check_magic = check_magic
+        self.sort_by_size = sort_by_size
+        self.chunk_size = chunk_size
+        self.extensions = frozenset(extensions)
+
+    def __call__(self, path):
+
+        """
+        Find the images of a directory
+
+        :param path: path of the directory
+
+        :return: iterator of paths (str), lazy
+        """
+
+        if not self.sort_by_size:
+            return self.iter_files(path)
+        return chain.from_iterable(self.iter_chunks(path))
+
+    def iter_chunks(self, path):
+
+        """
+        Find the images of a directory in lists of chunk_size paths
+
+        :param path: path of the directory
+
+        :return: iterator of lists of paths (str)
+        """
+
+        if not self.sort_by_size:
+            yield from iter_chunks(self.iter_files(path), self.chunk_size)
+            return
+
+        for chunk in iter_chunks(self.iter_entries(path), self.chunk_size):
+            chunk.sort(key=_entry_size)
+            yield [entry.path for entry in chunk]
+
+    def iter_files(self, path):
+
+        """
+        Find the images of a directory in the order of the file system
+
+        :param path: path of the directory
+
+        :return: iterator of paths (str)
+        """
+
+        for entry in self.iter_entries(path):
+            yield entry.path
+
+    def iter_entries(self, path):
+
+        """
+        Walk the directory tree, the subfolders that can not be read are skipped
+
+        :param path: path of the directory, OSError if it can not be read
+
+        :return: iterator of os.DirEntry of the images
+        """
+
+        root = os.fspath(path)
+        pending = [root]
+        while pending:
+            directory = pending.pop()
+            try:
+                scan = os.scandir(directory)
+            except OSError:
+                # a missing root is an error, an unreadable subfolder is skipped
+                if directory == root:
+                    raise
+                continue
+            with scan:
+                for entry in scan:
+                    if entry.name.startswith("."):
+                        continue
+                    try:
+                        # symbolic links to folders are not followed to avoid cycles
+                        if entry.is_dir(follow_symlinks=False):
+                            if self.recursive:
+                                pending.append(entry.path)
+                            continue
+                        if not entry.is_file():
+                            continue
+                    except OSError:
+                        continue
+                    if os.path.splitext(entry.name)[1].lower() not in self.extensions:
+                        continue
+                    if self.check_magic and not has_image_signature(entry.path):
+                        continue
+                    yield entry
+
+
+def _entry_size(entry) -> int:
+
+    try:
+        return entry.stat().st_size
+    except OSError:
+        return 0
@@ -0,0 +1,21 @@
+import sqlite3
+import threading
+
+
+def connect_shared(path: str) -> tuple:
+
+    """
+    Open a sqlite database shared by the threads of the process
+
+    The connection can be used from any thread, every access must hold the
+    lock. The database is in WAL mode, so other processes can read it while
+    it is written, and a locked database is waited for up to 30 seconds.
+
+    :param path: path of the sqlite database
+
+    :return: tuple (connection, lock)
+    """
+
+    connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    connection.execute("PRAGMA journal_mode=WAL")
+    return connection, threading.Lock()